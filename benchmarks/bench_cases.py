@@ -0,0 +1,111 @@
+"""Compare CaseReader with a hand-written row-by-row cursor loop for computing variable means
+
+Both read the same cases from the spssstub module and compute the mean of the valid values of each numeric
+variable, and the results are checked against each other.  The stub's cursor is plain Python, so the timings
+mostly reflect the conversion and accumulation work.  With the real spss module each cursor call crosses into
+the product, so the number of calls is reported as well.
+
+usage: python bench_cases.py [cases [numeric variables [blocksize]]]"""
+
+import os, sys, timeit
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [here, os.path.dirname(here)]
+import spssstub
+spssstub.install()
+import extension
+import spss
+
+def makedata(cases, numeric):
+    spssstub.variables = ["v%d" % j for j in range(numeric)] + ["name", "group"]
+    spssstub.vartypes = [0] * numeric + [16, 8]
+    spssstub.cases = [tuple([(i * 7 + j) % 11 == 0 and None or float((i * 31 + j) % 1000) for j in range(numeric)]
+        + ["case %d" % i, "g%d" % (i % 5)]) for i in range(cases)]
+    extension.invalidatevariableindex()
+
+def rowloop(varlist):
+    """The loop that implementations write: one fetchone call per case"""
+
+    index = extension.getvariableindex()
+    positions = [index.position(name) for name in varlist]
+    numeric = [k for k, p in enumerate(positions) if spss.GetVariableType(p) == 0]
+    sums, counts = [0.] * len(numeric), [0] * len(numeric)
+    cursor = spss.Cursor(positions, accessType="r")
+    try:
+        while True:
+            row = cursor.fetchone()
+            if row is None:
+                break
+            for i, k in enumerate(numeric):
+                value = row[k]
+                if value is not None:
+                    sums[i] += value
+                    counts[i] += 1
+    finally:
+        cursor.close()
+    return [s / c for s, c in zip(sums, counts)]
+
+def blockloop(varlist, blocksize):
+    """The same computation with CaseReader"""
+
+    reader = extension.CaseReader(varlist, blocksize=blocksize)
+    sums, counts = [0.] * len(reader.numericnames), [0] * len(reader.numericnames)
+    for block in reader:
+        if reader.numpy is not None:
+            valid = ~block.missing
+            sums = [s + x for s, x in zip(sums, reader.numpy.where(valid, block.numeric, 0.).sum(axis=1))]
+            counts = [c + x for c, x in zip(counts, valid.sum(axis=1))]
+        else:
+            for i, (values, missing) in enumerate(zip(block.numeric, block.missing)):
+                if True in missing:
+                    values = [v for v, m in zip(values, missing) if not m]
+                sums[i] += sum(values)
+                counts[i] += len(values)
+    return [s / c for s, c in zip(sums, counts)]
+
+class CallCounter(object):
+    """Count the calls to the cursor fetch methods while active"""
+
+    methods = ["fetchone", "fetchmany"]
+
+    def __enter__(self):
+        self.count = 0
+        self.saved = dict((m, getattr(spssstub.Cursor, m)) for m in self.methods)
+        for m, func in self.saved.items():
+            setattr(spssstub.Cursor, m, self.wrap(func))
+        return self
+
+    def wrap(self, func):
+        def counted(*args, **kwargs):
+            self.count += 1
+            return func(*args, **kwargs)
+        return counted
+
+    def __exit__(self, *exc):
+        for m, func in self.saved.items():
+            setattr(spssstub.Cursor, m, func)
+
+def main(cases=100000, numeric=20, blocksize=10000):
+    makedata(cases, numeric)
+    varlist = spssstub.variables
+    expected = rowloop(varlist)
+    result = blockloop(varlist, blocksize)
+    if max(abs(a - b) for a, b in zip(expected, result)) > 1e-9 * max(expected):
+        raise AssertionError("the means differ")
+    with CallCounter() as c:
+        rowloop(varlist)
+    rowcalls = c.count
+    with CallCounter() as c:
+        blockloop(varlist, blocksize)
+    blockcalls = c.count
+    old = min(timeit.repeat(lambda: rowloop(varlist), number=1, repeat=3))
+    new = min(timeit.repeat(lambda: blockloop(varlist, blocksize), number=1, repeat=3))
+    print("%d cases, %d numeric and 2 string variables, blocks of %d, NumPy %s" % (cases, numeric, blocksize,
+        extension.CaseReader(varlist).numpy is not None and "used" or "not available"))
+    print("%-12s %10s %14s" % ("loop", "ms", "cursor calls"))
+    print("%-12s %10.1f %14d" % ("row", old * 1000, rowcalls))
+    print("%-12s %10.1f %14d" % ("CaseReader", new * 1000, blockcalls))
+    print("ratio %.2f" % (old / new))
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:]])
@@ -0,0 +1,188 @@
+"""Microbenchmarks for the hot paths of extension.py, run against the spssstub module
+
+Each benchmark is timed at several input sizes and the best time per call is reported.
+
+usage:
+    python bench_extension.py [--json FILE] [--compare BASELINE] [--threshold FRACTION] [--filter TEXT]
+
+--json writes the results as JSON.  A file written this way can later be given to --compare, which
+reports the change for each benchmark and exits with status 1 if any benchmark is slower than the
+baseline by more than the threshold (default 0.25)."""
+
+import os, sys, json, timeit, argparse, platform, locale
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [here, os.path.dirname(here)]
+import spssstub
+spssstub.install()
+import extension
+
+mintime = 0.1   # seconds per timing run
+
+def timecall(func):
+    """Return the best time per call of func in seconds"""
+
+    number = 1
+    while True:
+        t = timeit.timeit(func, number=number)
+        if t >= mintime:
+            break
+        number *= 10 if t < mintime / 10 else 2
+    return min([t] + timeit.repeat(func, number=number, repeat=2)) / number
+
+def setvariables(n):
+    spssstub.variables[:] = ["v%d" % i for i in range(n)]
+    extension.invalidatevariableindex()
+
+def bench_template(size):
+    vallist = ["choice%d" % i for i in range(size)]
+    return lambda: extension.Template("KWD", ktype="str", islist=True, vallist=vallist)
+
+def parseitembench(ktype, values, vallist=None):
+    def bench(size):
+        oobj = extension.Syntax([extension.Template("KWD", ktype=ktype, islist=True, vallist=vallist)])
+        item = {"KWD": values(size)}
+        return lambda: oobj.parseitem("", item)
+    return bench
+
+def bench_parseitem_existingvarlist(size):
+    setvariables(size)
+    vardict = extension.getvariableindex()
+    oobj = extension.Syntax([extension.Template("", var="variables", ktype="existingvarlist", islist=True)])
+    item = {"TOKENLIST": ["v0", "to", "v%d" % (size - 1)]}
+    return lambda: oobj.parseitem("", item, vardict)
+
+def bench_getvarlist_all(size):
+    setvariables(size)
+    vardict = extension.getvariableindex()
+    return lambda: extension.getvarlist(["all"], True, vardict)
+
+def bench_getvarlist_names(size):
+    setvariables(size)
+    vardict = extension.getvariableindex()
+    names = ["V%d" % i for i in range(size)]
+    return lambda: extension.getvarlist(names, True, vardict)
+
+def bench_floatex(size):
+    values = ["1,234.5", "1.234,5", "$12.50", "3.25", "17%"] * (size // 5)
+    floatex = extension.floatex
+    return lambda: [floatex(v) for v in values]
+
+def bench_floatex_many(size):
+    values = ["1,234.5", "1.234,5", "$12.50", "3.25", "17%"] * (size // 5)
+    return lambda: extension.floatex_many(values)
+
+def bench_u(size):
+    values = ["value%d" % i for i in range(size)]
+    u = extension.u
+    return lambda: [u(v) for v in values]
+
+def bench_decodevalues(size):
+    values = ["value%d" % i for i in range(size)]
+    return lambda: extension.decodevalues(values, True)
+
+def bench_isseq(size):
+    values = ["a", ["a"], 1, ("a",), u"b"] * (size // 5)
+    isseq = extension._isseq
+    return lambda: [isseq(v) for v in values]
+
+def bench_checkrequiredparams(size):
+    names = ["p%d" % i for i in range(size)]
+    ns = {}
+    exec("def impl(%s, optional=None): pass" % ", ".join(names), ns)
+    params = dict((name, 1) for name in names)
+    return lambda: extension.checkrequiredparams(ns["impl"], params)
+
+def bench_pivot_messages(size):
+    table = extension.NonProcPivotTable("Warnings", tabletitle="Warnings")
+    for i in range(size):
+        table.addrow("message %d" % i)
+    return table.generate
+
+def bench_pivot_columns(size):
+    table = extension.NonProcPivotTable("Results", tabletitle="Results", columnlabels=["a", "b", "c"])
+    for i in range(size):
+        table.addrow("row %d" % i, [i, i * 0.5, "x"])
+    return table.generate
+
+benchmarks = [
+    ("Template", bench_template, [1, 100]),
+    ("parseitem bool", parseitembench("bool", lambda n: ["yes"] * n), [1, 1000]),
+    ("parseitem str", parseitembench("str", lambda n: ["Choice%d" % (i % 10) for i in range(n)],
+        ["choice%d" % i for i in range(10)]), [1, 1000]),
+    ("parseitem int", parseitembench("int", lambda n: [str(i) for i in range(n)]), [1, 1000, 10000]),
+    ("parseitem float", parseitembench("float", lambda n: ["%d.5" % i for i in range(n)]), [1, 1000, 10000]),
+    ("parseitem literal", parseitembench("literal", lambda n: ["Text"] * n), [1, 1000]),
+    ("parseitem varname", parseitembench("varname", lambda n: ["v%d" % i for i in range(n)]), [1, 1000]),
+    ("parseitem existingvarlist", bench_parseitem_existingvarlist, [100, 30000]),
+    ("getvarlist all", bench_getvarlist_all, [100, 30000]),
+    ("getvarlist names", bench_getvarlist_names, [100, 30000]),
+    ("floatex", bench_floatex, [100, 10000]),
+    ("floatex_many", bench_floatex_many, [100, 10000]),
+    ("u", bench_u, [100, 10000]),
+    ("decodevalues", bench_decodevalues, [100, 10000]),
+    ("_isseq", bench_isseq, [100, 10000]),
+    ("checkrequiredparams", bench_checkrequiredparams, [5, 100]),
+    ("NonProcPivotTable messages", bench_pivot_messages, [10, 1000, 10000]),
+    ("NonProcPivotTable columns", bench_pivot_columns, [10, 1000, 10000]),
+]
+
+def run(filtertext=None):
+    """Run the benchmarks and return a dictionary of seconds per call keyed by "name[size]" """
+
+    spssstub.procedurestate.append("Benchmarks")
+    results = {}
+    for name, setup, sizes in benchmarks:
+        if filtertext and not filtertext.lower() in name.lower():
+            continue
+        for size in sizes:
+            key = "%s[%d]" % (name, size)
+            results[key] = timecall(setup(size))
+            del spssstub.tables[:]
+            print("%-40s %14.3f us" % (key, results[key] * 1e6))
+    return results
+
+def compare(results, baseline, threshold):
+    """Print the change against baseline and return the names of benchmarks that regressed by more than threshold"""
+
+    regressions = []
+    print("\n%-40s %12s %12s %8s" % ("benchmark", "baseline us", "current us", "change"))
+    for key in sorted(results):
+        if not key in baseline:
+            continue
+        change = results[key] / baseline[key] - 1
+        flag = ""
+        if change > threshold:
+            regressions.append(key)
+            flag = "  REGRESSION"
+        print("%-40s %12.3f %12.3f %+7.1f%%%s" % (key, baseline[key] * 1e6, results[key] * 1e6, change * 100, flag))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark extension.py against the spss stub")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", help="compare with results previously written with --json")
+    parser.add_argument("--threshold", type=float, default=0.25, help="slowdown fraction reported as a regression")
+    parser.add_argument("--filter", help="run only benchmarks whose name contains this text")
+    options = parser.parse_args(argv)
+
+    results = run(options.filter)
+    if options.json:
+        fp = open(options.json, "w")
+        try:
+            json.dump({"python": platform.python_version(), "extension": extension.__version__,
+                "results": results}, fp, indent=1, sort_keys=True)
+        finally:
+            fp.close()
+    if options.compare:
+        fp = open(options.compare)
+        try:
+            baseline = json.load(fp)["results"]
+        finally:
+            fp.close()
+        if compare(results, baseline, options.threshold):
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
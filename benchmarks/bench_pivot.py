@@ -0,0 +1,132 @@
+"""Compare NonProcPivotTable.generate with the former cell-by-cell loop for one-column message tables
+
+The former loop is reproduced here as percellgenerate.  Both are run against the spssstub module,
+so the timings only reflect the Python side of the work.  With the real spss module each call
+into the product is far more expensive, so the number of such calls is reported as well.
+
+--memory instead compares the peak memory of building and generating a numeric table with
+NonProcPivotTable and with ColumnarPivotTable, each in a fresh interpreter.  Each cell is converted
+to a CellText object as the product would do, but the stub does not keep them.
+
+usage: python bench_pivot.py [rows ...]
+       python bench_pivot.py --memory [rows [columns]]"""
+
+import os, sys, timeit, subprocess, json
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [here, os.path.dirname(here)]
+import spssstub
+spssstub.install()
+import extension
+import spss
+
+def percellgenerate(self):
+    """NonProcPivotTable.generate for a table without columnlabels as it was before the bulk path"""
+
+    table = spss.BasePivotTable(self.tabletitle, self.omssubtype)
+    table.Append(spss.Dimension.Place.row,"rowdim",hideName=True,hideLabels=True)
+    table.Append(spss.Dimension.Place.column,"coldim",hideName=True,hideLabels=True)
+    colcat = spss.CellText.String("Message")
+    for r in self.rowlabels:
+        if isinstance(r, (int, float)):
+            r = str(r)
+        cellr = spss.CellText.String(r)
+        table[(cellr, colcat)] = cellr
+    return table
+
+class CallCounter(object):
+    """Count calls to the pivot table methods while active"""
+
+    methods = ["Append", "SetCategories", "SetCellsByColumn", "SimplePivotTable", "__setitem__"]
+
+    def __enter__(self):
+        self.count = 0
+        self.saved = dict((m, getattr(spssstub.BasePivotTable, m)) for m in self.methods)
+        for m, func in self.saved.items():
+            setattr(spssstub.BasePivotTable, m, self.wrap(func))
+        return self
+
+    def wrap(self, func):
+        def counted(*args, **kwargs):
+            self.count += 1
+            return func(*args, **kwargs)
+        return counted
+
+    def __exit__(self, *exc):
+        for m, func in self.saved.items():
+            setattr(spssstub.BasePivotTable, m, func)
+
+def maketable(rows):
+    t = extension.NonProcPivotTable("Warnings", tabletitle="Warnings")
+    for i in range(rows):
+        t.addrow("warning number %d for variable v%d" % (i, i % 97))
+    return t
+
+memorychild = r"""
+import sys, json, resource
+sys.path[:0] = [%(here)r, %(root)r]
+import spssstub
+spssstub.install()
+spssstub.procedurestate.append("bench")
+import extension
+# convert the cells as the product would, but do not keep them as the stub normally does
+def simplepivottable(self, rowdim="", rowlabels=[], coldim="", collabels=[], cells=None):
+    for c in cells:
+        spssstub.CellText.Number(c)
+def setcellsbycolumn(self, collabels, cells, cellType):
+    for c in cells:
+        cellType(c)
+spssstub.BasePivotTable.SimplePivotTable = simplepivottable
+spssstub.BasePivotTable.SetCellsByColumn = setcellsbycolumn
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+rows, columns = %(rows)d, %(columns)d
+labels = ["c%%d" %% j for j in range(columns)]
+t = getattr(extension, %(cls)r)("Stats", columnlabels=labels)
+for i in range(rows):
+    t.addrow("row %%d" %% i, [i * 0.5 + j for j in range(columns)])
+built = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+footprint = hasattr(t, "footprint") and t.footprint() or None
+t.generate()
+json.dump({"built": built - before, "peak": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before,
+    "footprint": footprint}, sys.stdout)
+"""
+
+def memory(rows=5000, columns=40):
+    """Print the memory growth in MB after building and after generating the table with each class"""
+
+    print("%d rows x %d numeric columns" % (rows, columns))
+    print("%-20s %12s %12s %14s" % ("class", "built MB", "peak MB", "footprint MB"))
+    for cls in ("NonProcPivotTable", "ColumnarPivotTable"):
+        code = memorychild % {"here": here, "root": os.path.dirname(here), "rows": rows, "columns": columns, "cls": cls}
+        r = json.loads(subprocess.Popen([sys.executable, "-c", code], stdout=subprocess.PIPE).communicate()[0])
+        # ru_maxrss is in kilobytes on Linux
+        print("%-20s %12.1f %12.1f %14s" % (cls, r["built"] / 1024., r["peak"] / 1024.,
+            r["footprint"] is not None and "%.1f" % (r["footprint"] / 1048576.) or "-"))
+
+def main(sizes=(10, 1000, 10000, 100000)):
+    spssstub.procedurestate.append("bench")
+    print("%8s %14s %14s %8s %14s %12s" % ("rows", "per cell ms", "bulk ms", "ratio", "per cell calls", "bulk calls"))
+    for rows in sizes:
+        t = maketable(rows)
+        del spssstub.tables[:]
+        t.generate()
+        bulk = spssstub.tables[-1].cells
+        if percellgenerate(t).cells != bulk:
+            raise AssertionError("bulk and per-cell tables differ for %d rows" % rows)
+        number = max(1, 100000 // rows)
+        with CallCounter() as c:
+            percellgenerate(t)
+        oldcalls = c.count
+        with CallCounter() as c:
+            t.generate()
+        newcalls = c.count
+        old = min(timeit.repeat(lambda: percellgenerate(t), number=number, repeat=3)) / number
+        new = min(timeit.repeat(t.generate, number=number, repeat=3)) / number
+        del spssstub.tables[:]
+        print("%8d %14.3f %14.3f %8.2f %14d %12d" % (rows, old * 1000, new * 1000, old / new, oldcalls, newcalls))
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--memory"]:
+        memory(*[int(a) for a in sys.argv[2:]])
+    else:
+        main(*[[int(a) for a in sys.argv[1:]]] if sys.argv[1:] else [])
@@ -0,0 +1,177 @@
+"""Replay a processcmd trace recorded with SPSS_EXTENSIONS_TRACE against the spssstub module
+
+Each recorded command is run with processcmd using a Syntax object rebuilt from the trace and, if one was
+recorded, a VariableIndex of the recorded names.  Implementations are not recorded, so a command runs a
+function that does nothing unless --modules names extension modules that register the command with
+extension.registercommand.
+
+The report gives the throughput and the p50, p99 and maximum latency of each command next to the recorded p50.
+--check also parses and checks each command on its own, with the parse cache turned off, and compares the
+parameters and the outcome with the recording, so a parser change can be validated on real traffic.  The outcome
+of the implementation is compared only if --modules supplies it; otherwise a command whose implementation failed
+is expected to pass the parse and check.  A command recorded with a vardict that is not a VariableIndex is
+replayed without one and is not checked.  The check parse is not timed and does not fill the cache, so the timed
+processcmd calls behave as they would without --check.  The exit status is 1 if anything differs.
+
+usage:
+    python bench_replay.py TRACE [--repeat N] [--check] [--nocache] [--modules NAME ...] [--json FILE]"""
+
+import os, sys, json, argparse, locale
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [here, os.path.dirname(here)]
+import spssstub
+spssstub.install()
+import extension
+
+def readtrace(filespec):
+    """Return the Syntax objects, VariableIndex objects and command records of the trace in filespec"""
+
+    syntaxes, dicts, runs = {}, {}, []
+    fp = open(filespec)
+    try:
+        for line in fp:
+            rec = json.loads(line)
+            if "run" in rec:
+                runs.append(rec)
+            elif "syntax" in rec:
+                templates = [extension.Template(kwd, subc, var, ktype, islist, vallist, lazy, asarray, abbrev)
+                    for kwd, subc, var, ktype, islist, vallist, lazy, asarray, abbrev in rec["templates"]]
+                oobj = extension.Syntax(templates, parent=rec["cmd"].replace(" ", "_") + ".py")
+                syntaxes[rec["syntax"]] = oobj
+            elif "dict" in rec:
+                dicts[rec["dict"]] = extension.VariableIndex(rec["names"])
+    finally:
+        fp.close()
+    return syntaxes, dicts, runs
+
+def replayimplementation(**params):
+    pass
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+def checkparse(oobj, args, f, options, vardict):
+    """Parse and check args as processcmd does before calling f and return (parameter digest, outcome).
+
+    As in the trace, the digest is taken before the check and is None if the parse fails, and the outcome is the
+    name of the exception if the parse or the check fails.  The parse cache is turned off, so that this neither
+    checks a cached result nor leaves one behind for the timed processcmd call."""
+
+    size = extension.parsecachesize
+    extension.parsecachesize = 0
+    digest = None
+    try:
+        try:
+            digest = extension.paramsdigest(oobj.parsecmd(args, vardict).parsedparams)
+            extension._preparecmd(oobj, args, f, options.get("excludedargs"), options.get("lastchancef"), vardict)
+            return digest, "ok"
+        except Exception:
+            return digest, sys.exc_info()[0].__name__
+    finally:
+        extension.parsecachesize = size
+
+def replay(syntaxes, dicts, runs, repeat=1, check=False):
+    """Run the commands and return (latencies by command, recorded latencies by command, mismatches, unchecked).
+
+    unchecked lists the commands that could not be checked because the names of their vardict were not recorded.
+    Without an implementation from --modules, only the parse and check phases are compared: a recorded failure
+    of the implementation is expected to pass them."""
+
+    timer = extension._timer
+    collector = extension.warningcollector = extension.WarningCollector(maxrows=None)
+    latencies, recorded, mismatches, unchecked = {}, {}, [], []
+    for r in range(repeat):
+        for i, rec in enumerate(runs):
+            oobj = syntaxes[rec["run"]]
+            vardict = None
+            if rec["dict"] is not None and rec["dict"] != "other":
+                vardict = dicts[rec["dict"]]
+            implemented = oobj.cmdname.upper() in extension.registeredcommands
+            f, options = replayimplementation, {}
+            if implemented:
+                f, options = extension.registeredcommands[oobj.cmdname.upper()][1:]
+            checking = check and r == 0
+            if checking and rec["dict"] == "other":
+                checking = False   # replayed without a vardict, so the expansions and errors would differ
+                unchecked.append(i)
+            if checking:
+                digest, parseoutcome = checkparse(oobj, rec["args"], f, options, vardict)
+                if rec["params"] is not None and digest != rec["params"]:
+                    mismatches.append((i, oobj.cmdname, "parameters"))
+            start = timer()
+            extension.processcmd(oobj, rec["args"], f, vardict=vardict, **options)
+            latencies.setdefault(oobj.cmdname, []).append(timer() - start)
+            outcome = collector.rows and collector.rows[-1][1] or "ok"
+            del collector.rows[:]
+            if checking:
+                failed = rec.get("failed")
+                if implemented:
+                    expected = rec["outcome"]
+                elif failed == "parse":
+                    outcome, expected = parseoutcome, rec["outcome"]
+                elif failed == "implementation" or rec["outcome"] == "ok":
+                    outcome, expected = parseoutcome, "ok"
+                else:
+                    expected = outcome   # a trace without failed does not say which phase failed
+                if outcome != expected:
+                    mismatches.append((i, oobj.cmdname, "outcome %s, recorded %s" % (outcome, expected)))
+            if r == 0:
+                recorded.setdefault(oobj.cmdname, []).append(rec["ms"] / 1000.)
+    return latencies, recorded, mismatches, unchecked
+
+def report(latencies, recorded):
+    """Print and return the statistics for each command"""
+
+    results = {}
+    print("%-30s %8s %10s %10s %10s %10s %12s" % ("command", "count", "cmds/s", "p50 ms", "p99 ms", "max ms",
+        "recorded p50"))
+    for cmdname in sorted(latencies):
+        values = sorted(latencies[cmdname])
+        stats = {"count": len(values), "throughput": len(values) / (sum(values) or 1e-9),
+            "p50": percentile(values, .5) * 1000, "p99": percentile(values, .99) * 1000, "max": values[-1] * 1000,
+            "recordedp50": percentile(sorted(recorded[cmdname]), .5) * 1000}
+        results[cmdname] = stats
+        print("%-30s %8d %10.0f %10.3f %10.3f %10.3f %12.3f" % (cmdname, stats["count"], stats["throughput"],
+            stats["p50"], stats["p99"], stats["max"], stats["recordedp50"]))
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a processcmd trace against the spss stub")
+    parser.add_argument("trace", help="trace file written with SPSS_EXTENSIONS_TRACE")
+    parser.add_argument("--repeat", type=int, default=1, help="number of times to replay the trace")
+    parser.add_argument("--check", action="store_true", help="compare parameters and outcomes with the recording")
+    parser.add_argument("--nocache", action="store_true", help="turn off the parse cache")
+    parser.add_argument("--modules", nargs="*", default=[], help="extension modules to import for implementations")
+    parser.add_argument("--json", help="write the statistics to this file")
+    options = parser.parse_args(argv)
+
+    try:
+        locale.setlocale(locale.LC_ALL, "")   # exception messages are converted with the locale encoding
+    except locale.Error:
+        pass
+    if options.nocache:
+        extension.parsecachesize = 0
+    for name in options.modules:
+        __import__(name)
+    spssstub.procedurestate.append("replay")
+    syntaxes, dicts, runs = readtrace(options.trace)
+    latencies, recorded, mismatches, unchecked = replay(syntaxes, dicts, runs, options.repeat, options.check)
+    results = report(latencies, recorded)
+    for i, cmdname, what in mismatches[:20]:
+        print("command %d (%s) differs from the recording: %s" % (i + 1, cmdname, what))
+    if options.check:
+        print("%d of %d commands differ from the recording" % (len(set(m[0] for m in mismatches)), len(runs)))
+        if unchecked:
+            print("%d commands were not checked because the names of their vardict were not recorded" %
+                len(unchecked))
+    if options.json:
+        fp = open(options.json, "w")
+        try:
+            json.dump(results, fp, indent=1, sort_keys=True)
+        finally:
+            fp.close()
+    return mismatches and 1 or 0
+
+if __name__ == "__main__":
+    sys.exit(main())
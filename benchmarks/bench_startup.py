@@ -0,0 +1,104 @@
+"""Measure import time and first-command latency of extension.py with and without fast start
+
+Each measurement runs in a fresh interpreter against the spssstub module.
+Set SPSSSTUB_PROBEDELAY to model the cost of the real plug-in version probe.
+The warm row submits the same command from a fresh interpreter to an extension.WarmPool;
+its import column is the import of extensionclient.
+
+usage: python bench_startup.py [repeats]"""
+
+import os, sys, subprocess, json, threading, time
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+child = r"""
+import sys, time, json
+t0 = time.time()
+sys.path[:0] = [%(here)r, %(root)r]
+import spssstub
+spssstub.install()
+spssstub.procedurestate.append("bench")
+t1 = time.time()
+import extension
+t2 = time.time()
+oobj = extension.Syntax([extension.Template("VALUE", ktype="int", islist=True),
+    extension.Template("MODE", ktype="str", vallist=["fast", "slow"])])
+def impl(value, mode="fast"):
+    return len(value)
+extension.processcmd(oobj, {"": [{"VALUE": ["1", "2", "3"]}, {"MODE": "fast"}]}, impl)
+t3 = time.time()
+json.dump({"import": t2 - t1, "firstcommand": t3 - t2}, sys.stdout)
+"""
+
+warmchild = r"""
+import sys, time, json
+sys.path[:0] = [%(root)r]
+t1 = time.time()
+import extensionclient
+t2 = time.time()
+client = extensionclient.WarmClient(%(address)r, %(authkey)r)
+client.submit("BENCH", {"": [{"VALUE": ["1", "2", "3"]}, {"MODE": "fast"}]})
+t3 = time.time()
+client.close()
+json.dump({"import": t2 - t1, "firstcommand": t3 - t2}, sys.stdout)
+"""
+
+def impl(value, mode="fast"):
+    return len(value)
+
+def warminit():
+    """Prepare a WarmPool worker: the stub and a registered command"""
+
+    import spssstub
+    spssstub.install()
+    spssstub.procedurestate.append("bench")
+    import extension
+    oobj = extension.Syntax([extension.Template("VALUE", ktype="int", islist=True),
+        extension.Template("MODE", ktype="str", vallist=["fast", "slow"])], parent="BENCH.py")
+    extension.registercommand("BENCH", oobj, impl)
+
+def measurewarm(repeats):
+    sys.path[:0] = [here, os.path.dirname(here)]
+    import spssstub
+    spssstub.install()
+    import extension
+    import bench_startup   # the initializer is found by module name in the worker, which has no such __main__
+    pool = extension.WarmPool(1, initializer=bench_startup.warminit)
+    # a Unix socket or pipe: the authentication handshake over TCP can wait for a delayed acknowledgement
+    server = threading.Thread(target=pool.serve, args=(None,))
+    server.daemon = True
+    server.start()
+    while pool.address is None:
+        time.sleep(0.01)
+    code = warmchild % {"root": os.path.dirname(here), "address": pool.address, "authkey": pool.authkey}
+    results = []
+    try:
+        for i in range(repeats):
+            out = subprocess.Popen([sys.executable, "-c", code], stdout=subprocess.PIPE).communicate()[0]
+            results.append(json.loads(out))
+        import extensionclient
+        extensionclient.WarmClient(pool.address, pool.authkey).shutdown()
+    finally:
+        pool.close()
+    return dict((k, sorted(r[k] for r in results)[repeats // 2]) for k in results[0])
+
+def measure(faststart, repeats):
+    env = dict(os.environ)
+    env["SPSS_EXTENSIONS_FASTSTART"] = faststart and "true" or "false"
+    code = child % {"here": here, "root": os.path.dirname(here)}
+    results = []
+    for i in range(repeats):
+        out = subprocess.Popen([sys.executable, "-c", code], env=env, stdout=subprocess.PIPE).communicate()[0]
+        results.append(json.loads(out))
+    return dict((k, sorted(r[k] for r in results)[repeats // 2]) for k in results[0])
+
+def main(repeats=9):
+    print("%-10s %12s %16s" % ("mode", "import ms", "first cmd ms"))
+    for faststart in (False, True):
+        r = measure(faststart, repeats)
+        print("%-10s %12.2f %16.2f" % (faststart and "fast" or "default", r["import"] * 1000, r["firstcommand"] * 1000))
+    r = measurewarm(repeats)
+    print("%-10s %12.2f %16.2f" % ("warm", r["import"] * 1000, r["firstcommand"] * 1000))
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:]])
@@ -0,0 +1,184 @@
+"""In-process stand-in for the parts of the spss module used by extension.py
+
+Call install() before importing extension so that the module can be imported and exercised
+without an SPSS Statistics installation.  Pivot tables are recorded in the tables list
+instead of being displayed."""
+
+import os, sys, time
+
+# seconds to spend in GetDefaultPlugInVersion in order to model the cost of the real probe
+probedelay = float(os.environ.get("SPSSSTUB_PROBEDELAY", "0"))
+pluginversion = "spss240"
+utf8mode = True
+tables = []
+procedurestate = []
+activedataset = "DataSet1"
+variables = []    # names in the active dataset dictionary
+vartypes = []    # 0 for numeric or the string width, by position; numeric if not given
+cases = []    # the cases read by Cursor, each a tuple of values for all the variables, with None for missing
+casecount = 0
+
+def install():
+    """Make this module importable as spss and return it"""
+
+    me = sys.modules[__name__]
+    sys.modules["spss"] = me
+    return me
+
+def GetDefaultPlugInVersion():
+    if probedelay:
+        time.sleep(probedelay)
+    return pluginversion
+
+def ActiveDataset():
+    return activedataset
+
+def GetVariableCount():
+    return len(variables)
+
+def GetVariableName(index):
+    return variables[index]
+
+def GetVariableType(index):
+    if index < len(vartypes):
+        return vartypes[index]
+    return 0
+
+def GetCaseCount():
+    return casecount
+
+class Cursor(object):
+    """Reads the cases list for the variables at the positions in var"""
+
+    def __init__(self, var=None, accessType="r", cvtDates=None, isBinary=True):
+        if var is None or var == []:
+            var = range(len(variables))
+        self.var = list(var)
+        self.position = 0
+        self.closed = False
+        cursors.append(self)
+
+    def SetUserMissingInclude(self, incMissing):
+        self.usermissing = incMissing
+
+    def fetchone(self):
+        rows = self._fetch(1)
+        if rows:
+            return rows[0]
+        return None
+
+    def fetchmany(self, n):
+        return self._fetch(n)
+
+    def _fetch(self, n):
+        if self.closed:
+            raise SystemError("cursor is closed")
+        rows = cases[self.position:self.position + n]
+        self.position += len(rows)
+        var = self.var
+        return tuple(tuple(row[i] for i in var) for row in rows)
+
+    def close(self):
+        self.closed = True
+
+cursors = []
+
+class PyInvokeSpss(object):
+    @staticmethod
+    def IsUTF8mode():
+        return utf8mode
+
+class CellText(object):
+    class String(object):
+        def __init__(self, value):
+            self.value = value
+        def __repr__(self):
+            return "String(%r)" % (self.value,)
+
+    class Number(object):
+        def __init__(self, value, formatspec=None):
+            self.value = float(value)
+        def __repr__(self):
+            return "Number(%r)" % (self.value,)
+
+class Dimension(object):
+    class Place(object):
+        row = 0
+        column = 1
+        layer = 2
+
+    def __init__(self, place, name):
+        self.place = place
+        self.name = name
+        self.categories = []
+
+def _value(cell):
+    return getattr(cell, "value", cell)
+
+class BasePivotTable(object):
+    """Records the table structure.  cells maps (row category, column category) values to cell values"""
+
+    def __init__(self, title, templateName, outline="", isSplit=True, caption=""):
+        if not procedurestate:
+            raise SystemError("no procedure state")
+        self.title = title
+        self.templateName = templateName
+        self.caption = caption
+        self.dimensions = []
+        self.cells = {}
+        tables.append(self)
+
+    def Caption(self, caption):
+        self.caption = caption
+
+    def SimplePivotTable(self, rowdim="", rowlabels=[], coldim="", collabels=[], cells=None):
+        rowlabels, collabels, cells = list(rowlabels), list(collabels), list(cells or [])
+        for i, r in enumerate(rowlabels):
+            for j, c in enumerate(collabels):
+                self.cells[(_value(r), _value(c))] = _value(cells[i * len(collabels) + j])
+
+    def Append(self, place, dimName, hideName=False, hideLabels=False):
+        dim = Dimension(place, dimName)
+        self.dimensions.append(dim)
+        return dim
+
+    def SetCategories(self, dim, categories):
+        if not isinstance(categories, (list, tuple)):
+            categories = [categories]
+        dim.categories = [_value(c) for c in categories]
+
+    def SetCellsByColumn(self, collabels, cells, cellType):
+        rowcats = [d for d in self.dimensions if d.place == Dimension.Place.row][0].categories
+        if len(cells) != len(rowcats):
+            raise ValueError("number of cells does not match the row categories")
+        col = _value(collabels)
+        for r, cell in zip(rowcats, cells):
+            self.cells[(r, col)] = _value(cellType(cell))
+
+    def __setitem__(self, key, value):
+        self.cells[tuple(_value(k) for k in key)] = _value(value)
+
+class TextBlock(object):
+    """Records the text block in tables"""
+
+    def __init__(self, name, content, outline=""):
+        if not procedurestate:
+            raise SystemError("no procedure state")
+        self.name = name
+        self.content = content
+        tables.append(self)
+
+    def append(self, line, skip=1):
+        self.content += "\n" * skip + line
+
+def Submit(command):
+    pass
+
+def StartProcedure(procname, omsidentifier=None):
+    procedurestate.append(procname)
+
+def EndProcedure():
+    procedurestate.pop()
+
+def EndDataStep():
+    pass
@@ -25,19 +25,85 @@
 # 26-aug-2014 add helper function for extension command help
 # 19-aug-2015 add fallback code to helper for browser file open failure
 # 04-nov-2015 guard against case mismatch in variable names
+# 17-oct-2026 compile Template objects into a per-keyword handler table in Syntax
+# 17-oct-2026 cache translation catalogs for the session
+# 17-oct-2026 import lazily, add SPSS_EXTENSIONS_FASTSTART and resolve the caller without reading source
+# 17-oct-2026 cache required parameter sets per implementing function
+# 17-oct-2026 add floatex_many for converting a batch of formatted values
+# 17-oct-2026 add VariableIndex for expanding variable lists without spssaux
+# 17-oct-2026 set one-column NonProcPivotTable cells in a single call
+# 17-oct-2026 optionally collect warnings from many commands into one table
+# 17-oct-2026 cache parse results for repeated command specifications
+# 17-oct-2026 optionally run implementations in a process pool
+# 17-oct-2026 add SPSS_EXTENSIONS_TIMING instrumentation
+# 17-oct-2026 check the Unicode mode once per Syntax or value list instead of once per value
+# 17-oct-2026 add syntaxfromxml to build Syntax from the extension XML specification
+# 17-oct-2026 add lazy existingvarlist values
+# 17-oct-2026 convert and range check number lists in bulk, optionally as arrays
+# 17-oct-2026 resolve enumerated values with a prefix tree, allow abbreviations and suggest close values
+# 17-oct-2026 make Syntax reusable across commands and threads with a ParseContext per parse
+# 17-oct-2026 add WarmPool, WarmClient and registercommand for running commands in warm worker processes
+# 17-oct-2026 add SPSS_EXTENSIONS_TRACE recording of processcmd calls for replay
+# 17-oct-2026 add ColumnarPivotTable for large tables
+# 17-oct-2026 add memoize for reusing the results and output of pure report commands
+# 17-oct-2026 add SPSS_EXTENSIONS_MEMORY measurement of the memory used by each phase of processcmd
+# 17-oct-2026 add CaseReader for reading the cases of a parsed variable list in blocks
+# 17-oct-2026 compare all the variable names in getvariableindex and share its fingerprint with memoize
+# 17-oct-2026 run memoized implementations without the result cache lock and record output per thread
+# 17-oct-2026 give each command of processcmds the timing, trace, memory and memoize handling of processcmd
+# 17-oct-2026 keep bool values of ColumnarPivotTable columns as labels, as _celltext does
+# 17-oct-2026 let processcmds run implementations in a bounded number of threads
+# 17-oct-2026 start the process pool workers as fresh interpreters with processpoolexecutable instead of forking
+# 17-oct-2026 drop a WarmPool worker that cannot be restarted instead of returning the dead one to the idle workers
+# 17-oct-2026 check the Unicode mode once per command rather than once per Syntax object
+# 17-oct-2026 check that the range of an int array fits its type so that asarray always gives an array
+# 17-oct-2026 lock the recorded timings, which commands in several threads add to
 
 __author__  =  'spss'
 __version__ =  '1.5.2'
 version = __version__
 
 import spss
-import inspect, sys
-import os, gettext, locale
+import sys
+import os, time, weakref, itertools, array, threading
+from collections import OrderedDict
+# inspect, gettext and locale are imported where they are used so that importing this module stays cheap
+
+# If the SPSS_EXTENSIONS_FASTSTART environment variable has the value "true", the plug-in version probe
+# and the translation setup are deferred until they are first needed.
+faststart = os.environ.get("SPSS_EXTENSIONS_FASTSTART", "").lower() == "true"
+if faststart:
+    ok1600 = None    # determined by plugin1600 on first use
+else:
+    ok1600 = spss.GetDefaultPlugInVersion()[-3:] >= '160'
+
+# If the SPSS_EXTENSIONS_TIMING environment variable has the value "true", processcmd records the time taken by
+# each phase of each command and by parsing each keyword type.  See timingstats.  If SPSS_EXTENSIONS_TIMINGFILE
+# is also set, the statistics are written to that file as JSON when the process exits.
+timingenabled = os.environ.get("SPSS_EXTENSIONS_TIMING", "").lower() == "true"
+if timingenabled and os.environ.get("SPSS_EXTENSIONS_TIMINGFILE"):
+    import atexit
+    atexit.register(lambda: writetimings(os.environ["SPSS_EXTENSIONS_TIMINGFILE"]))
+_timer = getattr(time, "perf_counter", time.time)
+
+# If the SPSS_EXTENSIONS_TRACE environment variable is set, processcmd appends a record of each command to the
+# JSON lines file it names.  See starttrace.
+tracer = None
+
+# If the SPSS_EXTENSIONS_MEMORY environment variable has the value "true", processcmd measures the memory used by
+# each phase of each command, or of a random fraction of the commands if the value is a number such as 0.05.
+# See MemoryProfiler.  If SPSS_EXTENSIONS_MEMORYFILE is also set, the statistics are written to that file as JSON
+# when the process exits.
+memoryprofiler = None
+
+def plugin1600():
+    """Return True if the plug-in is version 16 or later.  The plug-in is only queried the first time"""
+
+    global ok1600
+    if ok1600 is None:
+        ok1600 = spss.GetDefaultPlugInVersion()[-3:] >= '160'
+    return ok1600
 
-ok1600 = spss.GetDefaultPlugInVersion()[-3:] >= '160'
-
-# temporarily define function until Syntax class can do it right
-localizationStale = True
 
 
     # debugging
@@ -56,11 +122,12 @@ localizationStale = True
 #except:
     #pass
 
-try:
-    _("---")
-except:
-    def _(msg):
-        return msg
+def _(msg):
+    """Return msg translated for this module in the session language.
+
+    The catalog comes from the session catalog cache, so no translation state is kept here."""
+
+    return privatetranslation(__file__)(msg)
 
 class Template(object):
     """Define a syntax element
@@ -92,18 +159,19 @@ class Template(object):
     islist is True if values is a list (multiples) (SPSS keywordList or VariableNameList or NumberList)
       If islist, the var to receive the parsed values will get a list.
       existingvarlist is a list of existing variable names.  It supports SPSS TO and ALL conventions.
+    lazy applies to an existingvarlist with islist True.  If True, the var receives a LazyVarlist, which
+      expands and validates the names only when it is first used.
+    asarray applies to an int or float with islist True.  If True, the var receives an array.array
+      instead of a list.  For an int, the range must fit the array item, which may be 32 bits.
+    abbrev applies to a str or bool with a vallist.  If True, a value may be abbreviated to any prefix that
+      matches only one permitted value, and the var receives the full value.
       """
 
     ktypes = ["bool", "str", "int", "float", "literal", "varname", "existingvarlist"]
 
 
-    def __init__(self, kwd, subc='', var=None, ktype="str", islist=False, vallist=None):
-        global _, localizationStale
-        if localizationStale:
-            _ = transupport(__file__,private=True)
-            localizationStale = False
+    def __init__(self, kwd, subc='', var=None, ktype="str", islist=False, vallist=None, lazy=False, asarray=False, abbrev=False):
         if not ktype in Template.ktypes:
-            localizationStale = True
             raise ValueError(_("option type must be in: ") + " ".join(Template.ktypes))
         self.ktype = ktype
         self.kwd = kwd
@@ -113,10 +181,13 @@ class Template(object):
         else:
             self.var = var
         self.islist = islist
+        self.lazy = lazy
+        self.asarray = asarray
+        self.abbrev = abbrev
         if _isseq(vallist):
-            self.vallist = [u(v) for v in vallist]
+            self.vallist = decodevalues(vallist)
         else:
-            self.vallist = [u(vallist)]
+            self.vallist = decodevalues([vallist])
         if ktype == "bool" and vallist is None:
             self.vallist = ["true", "false", "yes", "no"]
         elif ktype in  ["int", "float"]:
@@ -133,6 +204,15 @@ class Template(object):
                     self.vallist[1] = vallist[1]
             except:
                 pass   # if vallist is None, len() will raise an exception
+            if ktype == "int" and asarray:
+                limit = 2 ** (8 * array.array(_inttypecode).itemsize - 1)
+                if not (-limit <= self.vallist[0] and self.vallist[1] < limit):
+                    raise ValueError(_("The range of an int array must be within %s and %s: %s") % (-limit, limit - 1, kwd))
+        # enumerations are compiled into a prefix tree for abbreviations and suggestions
+        if ktype in ["str", "bool"] and self.vallist and self.vallist[0] is not None:
+            self.trie = ValueTrie(self.vallist)
+        else:
+            self.trie = None
             
     def parse(self, item):
         key, value = item.items()[0]
@@ -161,6 +241,139 @@ class ExtBool(Template):
     def parse(self, item):
         key, value = super(ExtBool, self).parse(item)
 
+# Template ktype and islist for each ParameterType of the extension XML specification
+_xmltypes = {"Keyword": ("str", False), "KeywordList": ("str", True), "LeadingToken": ("bool", False),
+    "Integer": ("int", False), "IntegerList": ("int", True), "Number": ("float", False), "NumberList": ("float", True),
+    "QuotedString": ("literal", False), "QuotedStringList": ("literal", True), "TokenList": ("literal", True),
+    "VariableName": ("varname", False), "VariableNameList": ("existingvarlist", True),
+    "InputFile": ("literal", False), "OutputFile": ("literal", False)}
+
+# Templates read from XML specifications are saved next to the XML file in a cache file, which is used
+# as long as the XML file is unchanged.  The version is increased whenever the saved form changes.
+syntaxcacheversion = 1
+_xmltemplates = {}   # (xmlfile, overrides): (file stamp, Template list) for this session
+
+def syntaxfromxml(xmlfile, overrides=None, lang=None):
+    """Return a Syntax object for the extension command defined in the XML specification xmlfile.
+
+    Each Parameter of each Subcommand becomes a Template whose type follows the ParameterType.
+    Keyword enumerations become the vallist, and a Keyword whose only values are TRUE, FALSE, YES and NO
+    becomes a bool.  Min and Max attributes, if present, become the range of a number.
+    A subcommand with IsArbitrary="True" becomes an anonymous token list whose variable name is the
+    lower-cased subcommand name or "tokenlist" for the anonymous subcommand.
+    overrides is an optional dictionary mapping (subcommand, keyword) to a dictionary of Template arguments
+    that replace those derived from the XML, e.g., {("", "OUT"): {"var": "outfile"}}.  For an
+    arbitrary subcommand the keyword is "".
+    lang is as for Syntax.
+
+    The templates are read from the cache file next to xmlfile when it matches the XML file and are kept for the
+    session, so the XML is only parsed when it changes."""
+
+    xmlfile = os.path.abspath(xmlfile)
+    key = (xmlfile, overrides and repr(sorted(overrides.items())))
+    st = os.stat(xmlfile)
+    stamp = (st.st_mtime, st.st_size)
+    known = _xmltemplates.get(key)
+    if known is None or known[0] != stamp:
+        specs = _loadxmlspecs(xmlfile, stamp)
+        templates = []
+        for spec in specs:
+            spec = dict((str(k), v) for k, v in spec.iteritems())
+            for k in ["kwd", "subc", "var", "ktype"]:   # names as str as in a hand-written Template where possible
+                if spec[k] is not None:
+                    try:
+                        spec[k] = str(spec[k])
+                    except UnicodeError:
+                        pass
+            spec.update((overrides or {}).get((spec["subc"], spec["kwd"]), {}))
+            templates.append(Template(**spec))
+        known = _xmltemplates[key] = (stamp, templates)
+    return Syntax(known[1], lang=lang, parent=getparent(sys._getframe(1))[0][1])
+
+def _loadxmlspecs(xmlfile, stamp):
+    """Return the Template arguments for xmlfile from its cache file or, if that is stale, from the XML"""
+
+    import json, hashlib
+    cachefile = os.path.splitext(xmlfile)[0] + ".syntaxcache"
+    try:
+        fp = open(cachefile)
+        try:
+            cache = json.load(fp)
+        finally:
+            fp.close()
+        if cache["version"] == syntaxcacheversion and cache["stamp"] == list(stamp):
+            return cache["templates"]
+    except (IOError, ValueError, KeyError, TypeError):
+        cache = None
+    fp = open(xmlfile, "rb")
+    try:
+        content = fp.read()
+    finally:
+        fp.close()
+    digest = hashlib.sha1(content).hexdigest()
+    if cache and cache.get("version") == syntaxcacheversion and cache.get("sha1") == digest:
+        specs = cache["templates"]   # the file was touched but not changed
+    else:
+        # a round trip through json gives the same string types as reading the cache
+        specs = json.loads(json.dumps(_xmlspecs(content)))
+    try:
+        tempfile = cachefile + ".%d" % os.getpid()
+        fp = open(tempfile, "w")
+        try:
+            json.dump({"version": syntaxcacheversion, "stamp": list(stamp), "sha1": digest, "templates": specs}, fp)
+        finally:
+            fp.close()
+        if os.path.exists(cachefile):
+            os.remove(cachefile)
+        os.rename(tempfile, cachefile)
+    except (IOError, OSError):
+        pass   # the cache is optional, e.g., if the extension directory is not writable
+    return specs
+
+def _xmlspecs(content):
+    """Return a list of Template argument dictionaries for the extension XML specification content"""
+
+    import xml.etree.ElementTree as ElementTree
+    def local(element):
+        return element.tag.rsplit("}", 1)[-1]   # ignore the namespace
+    def children(element, name):
+        return [e for e in element if local(e) == name]
+    root = ElementTree.fromstring(content)
+    if local(root) != "Command":
+        raise ValueError(_("The extension specification does not have a Command element at its root"))
+    specs = []
+    for sub in children(root, "Subcommand"):
+        subc = sub.get("Name", "")
+        if sub.get("IsArbitrary", "False").lower() == "true":
+            params = children(sub, "Parameter")
+            ktype = "literal"
+            if params:
+                ktype = _xmltypes.get(params[0].get("ParameterType"), ("literal", True))[0]
+            specs.append({"kwd": "", "subc": subc, "var": subc.lower() or "tokenlist", "ktype": ktype, "islist": True,
+                "vallist": None})
+            continue
+        for param in children(sub, "Parameter"):
+            ktype, islist = _xmltypes.get(param.get("ParameterType"), ("literal", False))
+            vallist = [e.get("Name").lower() for e in children(param, "EnumValue")]
+            if ktype == "str" and vallist and set(vallist) <= set(["true", "false", "yes", "no"]):
+                ktype = "bool"
+            if ktype in ["bool", "str"]:
+                vallist = vallist or None
+            elif ktype in ["int", "float"]:
+                convert = ktype == "int" and int or float
+                low, high = param.get("Min"), param.get("Max")
+                if high is not None:
+                    vallist = [None if low is None else convert(low), convert(high)]
+                elif low is not None:
+                    vallist = [convert(low)]
+                else:
+                    vallist = None
+            else:
+                vallist = None
+            specs.append({"kwd": param.get("Name"), "subc": subc, "var": None, "ktype": ktype, "islist": islist,
+                "vallist": vallist})
+    return specs
+
 def setnegativedefaults(choices, params):
     """Add explicit negatives for omitted choices if any were explicitly included.
 
@@ -175,12 +388,17 @@ def setnegativedefaults(choices, params):
 
 
 class Syntax(object):
-    """Validate syntax according to template and build argument dictionary."""
+    """Validate syntax according to template and build argument dictionary.
+
+    A Syntax object does not change once it is built, and each parse produces a separate ParseContext,
+    so one object can be built when the extension module is imported and used for every command,
+    from any number of threads."""
 
-    def __init__(self, templ, lang=None):
+    def __init__(self, templ, lang=None, parent=None):
         """templ is a sequence of one or more Template objects.
         lang optionally specifies a language for translation.  In internal mode, lang will automatically
-        match the current SPSS output language if lang is not specified here."""
+        match the current SPSS output language if lang is not specified here.
+        parent is the file name of the extension module.  By default it is the module creating the Syntax object."""
 
         # Syntax builds a dictionary of subcommands, where each entry is a parameter dictionary for the subcommand.
         ##debugging
@@ -194,45 +412,128 @@ class Syntax(object):
         #except:
             #pass
 
-        self.unicodemode = ok1600 and spss.PyInvokeSpss.IsUTF8mode()
-        if self.unicodemode:
-            self.unistr = unicode
-        else:
-            self.unistr = str
-
         self.subcdict = {}
         for t in templ:
             if not t.subc in self.subcdict:
                 self.subcdict[t.subc] = {}
             self.subcdict[t.subc][t.kwd] = t
-        self.parsedparams = {}
-
-        # Set up private translation for the extension module and possible translation 
-        # of the parent module based on the name of the calling module.
+        self._local = threading.local()   # the last ParseContext of each thread, for parsedparams
 
-        parent = getparent(sys._getframe(1))
+        # messages from parsing use this object's own translation of this module
+        self.lang = lang
+        if faststart:
+            self.translate = deferredtranslation(__file__, private=True, lang=lang)
+        else:
+            self.translate = privatetranslation(__file__, lang=lang)
+
+        # compile each template once into a converter/validator so that parseitem
+        # only has to look up the handler for a keyword and call it.
+        self.handlers = {}
+        for subc, kwds in self.subcdict.iteritems():
+            self.handlers[subc] = dict((kwd, compiletemplate(t, self.translate))
+                for kwd, t in kwds.iteritems())
+        # identifies equivalent Syntax objects in the parse cache
+        self.signature = repr((sorted((subc, kwd, t.var, t.ktype, t.islist, t.vallist, t.lazy, t.asarray, t.abbrev)
+            for subc, kwds in self.subcdict.iteritems() for kwd, t in kwds.iteritems())))
+
+        # Set up translation of the parent module based on the name of the calling module.
+        # The parent module uses _ from builtins, so this is the one translation that stays global.
+
+        if parent is None:
+            parent = getparent(sys._getframe(1))[0][1]
+        # the command name as identified in collected warnings, e.g., SPSSINC_CENSOR_TABLES.py -> SPSSINC CENSOR TABLES
+        self.cmdname = os.path.splitext(os.path.basename(parent))[0].replace("_", " ")
         ###transupport (inspect.stack()[1][1], private=False)
-        transupport(parent[0][1], private=False)
-        global localizationStale
-        localizationStale = True  # to force the Template class to reset the next time through
+        if faststart:
+            _builtins()._ = deferredtranslation(parent, private=False)
+        else:
+            transupport(parent, private=False)
 
+    def _getunicodemode(self):
+        return sessionunicodemode()
+
+    def _getunistr(self):
+        return sessionunicodemode() and unicode or str
+
+    unicodemode = property(_getunicodemode, doc="""True if SPSS is now in Unicode mode.  Each parse checks the mode once""")
+    unistr = property(_getunistr, doc="""The string type for the current mode""")
+
+    def _getparsedparams(self):
+        context = getattr(self._local, "context", None)
+        if context is None:
+            context = self._local.context = ParseContext(self)
+        return context.parsedparams
+
+    def _setparsedparams(self, params):
+        context = self._local.context = ParseContext(self)
+        context.parsedparams = params
+
+    parsedparams = property(_getparsedparams, _setparsedparams,
+        doc="""The parameter dictionary of the last command parsed in the calling thread""")
 
     def parsecmd(self, cmd, vardict=None):
         """Iterate over subcommands parsing each specification.
 
         cmd is the command specification passed to the module Run method via the EXTENSION definition.
         vardict is used if an existingvarlist type is included to expand and validate the variable names.  If not supplied,
-        names are returned without validation."""
-
+        names are returned without validation.
+        
+        Return a ParseContext holding the parameters of this command only.  Until the next parse in the same
+        thread, its parsedparams are also this object's parsedparams.
+
+        Results are cached for the session (see parsecachesize), so repeating a command with the same
+        specification does not repeat the parse.  With a vardict, results are only cached if it is a VariableIndex.
+        The Unicode mode is checked once for the command, and results are cached separately for each mode."""
+
+        context = self._local.context = ParseContext(self)
+        params = context.parsedparams
+        unicodemode = sessionunicodemode()
+        if parsecachesize <= 0 or not (vardict is None or isinstance(vardict, VariableIndex)):
+            parsestats["uncached"] += 1
+            self._parsecmd(cmd, vardict, params, unicodemode)
+            return context
+        key = (self.signature, unicodemode, vardict is not None and vardict.version, repr(cmd))
+        _parsecachelock.acquire()
+        try:
+            cached = _parsecache.pop(key, None)
+            if cached is not None:
+                parsestats["hits"] += 1
+                _parsecache[key] = cached   # reinsert as most recently used
+            else:
+                parsestats["misses"] += 1
+        finally:
+            _parsecachelock.release()
+        if cached is not None:
+            for var, value, copy in cached:
+                if copy is not None:
+                    value = copy(value)
+                params[var] = value
+            return context
+        self._parsecmd(cmd, vardict, params, unicodemode)
+        # the cache keeps its own copy of list and array values so that the implementation cannot alter it
+        entry = tuple(_cacheentry(var, value) for var, value in params.iteritems())
+        _parsecachelock.acquire()
+        try:
+            _parsecache[key] = entry
+            while len(_parsecache) > parsecachesize:
+                _parsecache.popitem(last=False)
+                parsestats["evictions"] += 1
+        finally:
+            _parsecachelock.release()
+        return context
+
+    def _parsecmd(self, cmd, vardict, params, unicodemode):
         for sc in cmd.keys():
             for p in cmd[sc]:   #cmd[sc] is a subcommand, which is a list of keywords and values
-                self.parseitem(sc, p, vardict)
+                self.parseitem(sc, p, vardict, params, unicodemode)
 
-    def parseitem(self, subc, item, vardict=None):
+    def parseitem(self, subc, item, vardict=None, params=None, unicodemode=None):
         """Add parsed item to call dictionary.  
 
         subc is the subcommand for the item 
         item is a dictionary containing user specification.
+        params is the dictionary to add the item to.  By default it is parsedparams.
+        unicodemode is the result of sessionunicodemode for the command.  By default it is checked for this item.
 
         subc and item will already have been basically checked by the SPSS EXTENSION parser, so we can take it from there.
         If an undefined subcommand or keyword occurs (which should not happen if the xml and Template specifications are consistent), 
@@ -245,42 +546,265 @@ class Syntax(object):
         #value = value[0]   # value could be a list
         if not _isseq(value):
             value = [value]   # SPSS will have screened out invalid lists
-        value = [u(v) for v in value]
+        if unicodemode is None:
+            unicodemode = sessionunicodemode()
+        value = decodevalues(value, unicodemode)
+        unistr = unicodemode and unicode or str
+        if params is None:
+            params = self.parsedparams
         try:
-            kw = self.subcdict[subc][key]  # template for this keyword
+            handler = self.handlers[subc][key]  # compiled template for this keyword
         except KeyError, e:
-            raise KeyError(_("A syntax keyword was used that is not defined in the extension module Syntax object: %s") % e.args[0])
-        if kw.ktype in ['bool', 'str']:
-            value = [self.unistr(v).lower() for v in value]
-            if not kw.vallist[0] is None:
-                for v in value:
-                    if not v in kw.vallist:
-                        raise AttributeError, _("Invalid value for keyword: ") + key + ": " + v
-            if kw.ktype == "str":
-                self.parsedparams[kw.var] = getvalue(value, kw.islist)
-            else:
-                self.parsedparams[kw.var] = getvalue(value, kw.islist) in ["true", "yes", None]
-        elif kw.ktype in ["varname", "literal"]:
-            self.parsedparams[kw.var] = getvalue(value, kw.islist)
-        elif kw.ktype in ["int", "float"]:
-            if kw.ktype == "int":
-                value = [int(v) for v in value]
+            raise KeyError(self.translate("A syntax keyword was used that is not defined in the extension module Syntax object: %s") % e.args[0])
+        if timingenabled:
+            start = _timer()
+            handler(value, vardict, params, unistr)
+            _lap(self.cmdname, "parse " + self.subcdict[subc][key].ktype, start)
+        else:
+            handler(value, vardict, params, unistr)
+
+class ParseContext(object):
+    """The result of parsing one command with a Syntax object
+
+    parsedparams is the parameter dictionary for the implementation.  cmdname is the command name of the Syntax
+    object, so a ParseContext can be given to reportexception in place of the Syntax object."""
+
+    def __init__(self, syntax):
+        self.syntax = syntax
+        self.cmdname = syntax.cmdname
+        self.parsedparams = {}
+        self.digest = None   # paramsdigest of the parse result when tracing
+
+# Parse results are cached for the session keyed by the Syntax signature, the vardict version and the
+# command specification.  The least recently used entry is dropped when there are more than parsecachesize
+# entries.  Setting parsecachesize to 0 turns the cache off.
+parsecachesize = 256
+_parsecache = OrderedDict()
+_parsecachelock = threading.Lock()
+parsestats = {"hits": 0, "misses": 0, "evictions": 0, "uncached": 0}
+
+def parsecachestats():
+    """Return a copy of the parse cache counters with the current size and hit rate added"""
+
+    stats = dict(parsestats)
+    lookups = stats["hits"] + stats["misses"]
+    stats["size"] = len(_parsecache)
+    stats["hitrate"] = lookups and float(stats["hits"]) / lookups or 0.
+    return stats
+
+def clearparsecache():
+    """Empty the parse cache and reset its counters"""
+
+    _parsecachelock.acquire()
+    try:
+        _parsecache.clear()
+        for k in parsestats:
+            parsestats[k] = 0
+    finally:
+        _parsecachelock.release()
+
+def _cacheentry(var, value):
+    """Return (var, stored value, function to copy the stored value or None) for the parse cache"""
+
+    if isinstance(value, list):
+        return var, tuple(value), list
+    if isinstance(value, array.array):
+        return var, value[:], _copyslice
+    return var, value, None
+
+def _copyslice(value):
+    return value[:]
+
+def compiletemplate(kw, tr=None):
+    """Return a handler for Template kw.
+
+    handler(value, vardict, params, unistr) converts and validates the list of values for the keyword and stores
+    the result in the params dictionary under the keyword's variable name.  unistr is the string type for
+    the mode of the command being parsed.  tr translates the handler's error messages and defaults to _.
+    The enumeration and range limits are bound into the handler when it is built."""
+
+    return _compilers[kw.ktype](kw, tr or _)
+
+def _compilestr(kw, tr):
+    var, islist = kw.var, kw.islist
+    trie = kw.trie
+    if trie is None:
+        allowed = None
+    else:
+        allowed = trie.values
+    isbool = kw.ktype == "bool"
+    abbrev = kw.abbrev
+    def handler(value, vardict, params, unistr):
+        value = [unistr(v).lower() for v in value]
+        if allowed is not None:
+            for i, v in enumerate(value):
+                if not v in allowed:
+                    # not a permitted value as written: try it as an abbreviation
+                    full = abbrev and trie.resolve(v) or None
+                    if full is None:
+                        raise _invalidvalue(kw, v, tr)
+                    value[i] = full
+        if isbool:
+            params[var] = getvalue(value, islist) in ["true", "yes", None]
+        else:
+            params[var] = getvalue(value, islist)
+    return handler
+
+def _invalidvalue(kw, v, tr):
+    """Return the exception for value v of keyword kw, naming the permitted values closest to it"""
+
+    matches = kw.abbrev and kw.trie.complete(v) or []
+    if len(matches) > 1:
+        return AttributeError(tr("Ambiguous abbreviation for keyword: ") + kw.kwd + ": " + v + ".  " +
+            tr("It could be: %s") % ", ".join(matches[:10]))
+    candidates = kw.trie.closest(v)
+    msg = tr("Invalid value for keyword: ") + kw.kwd + ": " + v
+    if candidates:
+        msg = msg + ".  " + tr("Did you mean: %s") % ", ".join(candidates)
+    return AttributeError(msg)
+
+class ValueTrie(object):
+    """Prefix tree of the permitted values of an enumerated keyword
+
+    Each node is a dictionary from a character to the next node.  A node that ends a value maps None
+    to that value.  Finding a value or a prefix takes time proportional to its length, not to the number
+    of permitted values."""
+
+    def __init__(self, values):
+        self.values = frozenset(values)
+        self.root = {}
+        for v in self.values:
+            node = self.root
+            for c in v:
+                node = node.setdefault(c, {})
+            node[None] = v
+
+    def find(self, prefix):
+        """Return the node for prefix or None if no value starts with it"""
+
+        node = self.root
+        for c in prefix:
+            node = node.get(c)
+            if node is None:
+                return None
+        return node
+
+    def resolve(self, prefix):
+        """Return the value that prefix is equal to or the only value that starts with prefix.
+
+        If prefix matches no value or more than one, return None."""
+
+        node = self.find(prefix)
+        if node is None or not prefix:
+            return None
+        if None in node:
+            return node[None]
+        while len(node) == 1:
+            c, node = node.items()[0]
+            if c is None:
+                return node
+        return None   # branches into more than one value
+
+    def complete(self, prefix):
+        """Return the sorted list of values starting with prefix"""
+
+        node = self.find(prefix)
+        result = []
+        stack = node is not None and [node] or []
+        while stack:
+            node = stack.pop()
+            for c, child in node.iteritems():
+                if c is None:
+                    result.append(child)
+                else:
+                    stack.append(child)
+        return sorted(result)
+
+    def closest(self, value, n=3):
+        """Return up to n permitted values closest to value.
+
+        Close spellings come first.  Otherwise the values sharing the longest prefix with value are used."""
+
+        import difflib
+        candidates = difflib.get_close_matches(value, self.values, n)
+        if not candidates:
+            node = self.root
+            for i, c in enumerate(value):
+                if c not in node:
+                    break
+                node = node[c]
             else:
-                value = [float(v) for v in value]
-            for v in value:
-                if not (kw.vallist[0] <= v <= kw.vallist[1]):
-                    raise ValueError, _("Value for keyword is out of range: %s") % kw.kwd
-            self.parsedparams[kw.var] = getvalue(value, kw.islist)
-        elif kw.ktype in ['existingvarlist']:
-            self.parsedparams[kw.var] = getvarlist(value, kw.islist, vardict)
-            # double check because of possible case mismatch
-            varlist = self.parsedparams[kw.var]
-            if not _isseq(varlist):
-                varlist = [varlist]
-            if vardict:
-                for v in varlist:
-                    if not v in vardict:
-                        raise ValueError(_("Invalid variable name: %s.  Variable names are case sensitive") % v)            
+                i = len(value)
+            if i > 0:
+                candidates = self.complete(value[:i])[:n]
+        return candidates
+
+def _compileliteral(kw, tr):
+    var, islist = kw.var, kw.islist
+    def handler(value, vardict, params, unistr):
+        params[var] = getvalue(value, islist)
+    return handler
+
+def _compilenumber(kw, tr):
+    var, islist = kw.var, kw.islist
+    convert = kw.ktype == "int" and int or float
+    lo, hi = kw.vallist[0], kw.vallist[1]
+    if islist:
+        return _compilenumberlist(kw, convert, lo, hi, tr)
+    def handler(value, vardict, params, unistr):
+        value = [convert(v) for v in value]
+        for v in value:
+            if not (lo <= v <= hi):
+                raise ValueError(tr("Value for keyword is out of range: %s") % kw.kwd)
+        params[var] = getvalue(value, islist)
+    return handler
+
+# array type codes for int lists.  "q" (64-bit) is not available in Python 2
+_inttypecode = "q" in getattr(array, "typecodes", "") and "q" or "l"
+
+def _compilenumberlist(kw, convert, lo, hi, tr):
+    """Return the handler for a list of numbers.
+
+    The whole list is converted with one map call, and the range is checked with min and max, so only a list
+    with a value out of range is examined value by value.  All the positions out of range are reported."""
+
+    var = kw.var
+    isfloat = convert is float
+    typecode = isfloat and "d" or _inttypecode
+    asarray = kw.asarray
+    def handler(value, vardict, params, unistr):
+        value = list(map(convert, value))
+        if value and not (lo <= min(value) and max(value) <= hi and (not isfloat or sum(value) == sum(value))):
+            # sum is NaN if some value is NaN, which min and max do not catch
+            bad = [str(i + 1) for i, v in enumerate(value) if not (lo <= v <= hi)]
+            if len(bad) > 20:
+                bad[20:] = ["..."]
+            raise ValueError(tr("Value for keyword is out of range: %s.  Positions: %s") % (kw.kwd, ", ".join(bad)))
+        if asarray:
+            value = array.array(typecode, value)   # Template checked that the range fits
+        params[var] = value
+    return handler
+
+def _compilevarlist(kw, tr):
+    var, islist = kw.var, kw.islist
+    if islist and kw.lazy:
+        def handler(value, vardict, params, unistr):
+            params[var] = LazyVarlist(value, vardict)
+        return handler
+    def handler(value, vardict, params, unistr):
+        params[var] = getvarlist(value, islist, vardict)
+        # double check because of possible case mismatch
+        varlist = params[var]
+        if not _isseq(varlist):
+            varlist = [varlist]
+        if vardict and not isinstance(vardict, VariableIndex):   # VariableIndex returns dictionary names
+            for v in varlist:
+                if not v in vardict:
+                    raise ValueError(tr("Invalid variable name: %s.  Variable names are case sensitive") % v)
+    return handler
+
+_compilers = {"bool": _compilestr, "str": _compilestr, "int": _compilenumber, "float": _compilenumber,
+    "literal": _compileliteral, "varname": _compileliteral, "existingvarlist": _compilevarlist}
 
 def getparent(frame):
     """get the parent without resorting to entire calling stack"""
@@ -290,10 +814,13 @@ def getparent(frame):
     # sometimes fails.  It trips over an empty file name in a frame
     # This function avoids going back up the stack any more than necessary
     # Remnants of the stack.getouterframe api function remain here
+    # The file name comes straight from the code object, so no source lines are read.
+    # The context and index entries of the inspect frame record are always None.
     
     framelist = []
     ###while frame:  # need to limit this
-    framelist.append((frame,) + inspect.getframeinfo(frame, 1))
+    code = frame.f_code
+    framelist.append((frame, code.co_filename, frame.f_lineno, code.co_name, None, None))
     frame = frame.f_back
     return framelist    
 
@@ -326,6 +853,310 @@ def getvarlist(value, islist, vardict):
             return v[0]
         return 
 
+_indexversions = itertools.count(1)
+
+class VariableIndex(object):
+    """Index of the variable names in a dataset dictionary for expanding and validating variable lists.
+
+    An instance can be passed as the vardict argument of Syntax.parsecmd or processcmd.
+    Names are looked up without regard to case and expanded lists always contain the names as
+    spelled in the dictionary, so the case mismatch check in the parser is not needed.
+    TO ranges are expanded by position, so their cost depends only on the length of the range."""
+
+    def __init__(self, names=None):
+        """names is the sequence of variable names in dictionary order.  If None, the names are
+        taken from the active dataset."""
+
+        if names is None:
+            names = [spss.GetVariableName(i) for i in xrange(spss.GetVariableCount())]
+        self.names = decodevalues(names)
+        self.version = next(_indexversions)   # distinguishes indexes in the parse cache
+        self.fingerprint = None   # set by getvariableindex
+        self.positions = dict((name, i) for i, name in enumerate(self.names))
+        self.folded = dict((name.lower(), i) for i, name in enumerate(self.names))
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.positions
+
+    def position(self, name):
+        """Return the dictionary position of name, ignoring case.  Raise ValueError if it is not a variable"""
+
+        i = self.positions.get(name)
+        if i is None:
+            if isinstance(name, basestring):
+                i = self.folded.get(name.lower())
+            if i is None:
+                raise ValueError(_("Invalid variable name: %s") % name)
+        return i
+
+    def spans(self, varlist):
+        """Return the expansion of varlist as a list of (start, end) position ranges.
+
+        varlist is as for expand.  The names are checked but not copied."""
+
+        if isinstance(varlist, basestring):
+            varlist = varlist.split()
+        spans = []
+        i, n = 0, len(varlist)
+        while i < n:
+            token = varlist[i]
+            ltoken = token.lower()
+            if ltoken == "all":
+                spans.append((0, len(self.names)))
+            elif ltoken == "to":
+                if not spans or i + 1 == n or varlist[i-1].lower() in ["to", "all"]:
+                    raise ValueError(_("Incomplete TO specification in variable list"))
+                start = spans[-1][1] - 1   # the variable before TO
+                end = self.position(varlist[i+1])
+                if end < start:
+                    raise ValueError(_("Variables in TO specification are in the wrong order: %s TO %s") %
+                        (self.names[start], varlist[i+1]))
+                spans.append((start + 1, end + 1))
+                i += 1
+            else:
+                p = self.position(token)
+                spans.append((p, p + 1))
+            i += 1
+        return spans
+
+    def expand(self, varlist):
+        """Return a list of variable names with TO and ALL expanded.
+
+        varlist is a sequence of names or a blank-separated string.
+        Raise ValueError if a name does not exist or a TO range is incomplete or reversed."""
+
+        names = self.names
+        result = []
+        for start, end in self.spans(varlist):
+            if end - start == 1:
+                result.append(names[start])
+            else:
+                result.extend(names[start:end])
+        return result
+
+    def count(self, varlist):
+        """Return the number of names in the expansion of varlist without building it"""
+
+        return sum(end - start for start, end in self.spans(varlist))
+
+class LazyVarlist(object):
+    """Read-only sequence of variable names from an existingvarlist specification that is expanded on first use.
+
+    The specification is kept as written, including TO and ALL.  It is expanded and validated with the vardict
+    the first time the names are needed, so invalid names are reported with the same messages as for an
+    ordinary existingvarlist, but only when the list is used.  With a VariableIndex, len() does not expand it."""
+
+    def __init__(self, tokens, vardict=None):
+        self.tokens = tokens
+        self.vardict = vardict
+        self._names = None
+
+    def _expanded(self):
+        if self._names is None:
+            names = getvarlist(self.tokens, True, self.vardict)
+            if self.vardict and not isinstance(self.vardict, VariableIndex):
+                for v in names:
+                    if not v in self.vardict:
+                        raise ValueError(_("Invalid variable name: %s.  Variable names are case sensitive") % v)
+            self._names = names
+        return self._names
+
+    def __len__(self):
+        if self._names is None and isinstance(self.vardict, VariableIndex):
+            return self.vardict.count(self.tokens)
+        return len(self._expanded())
+
+    def __iter__(self):
+        return iter(self._expanded())
+
+    def __getitem__(self, index):
+        return self._expanded()[index]
+
+    def __contains__(self, name):
+        return name in self._expanded()
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "LazyVarlist(%r)" % (self.tokens,)
+
+# VariableIndex for the active dataset and the dictionarytoken value it was built for
+_activeindex = [None, None]
+# the index that getvariableindex last returned in each thread, until processcmd finishes a command in that thread
+_checkedindex = threading.local()
+
+def dictionarytoken():
+    """Return a value that changes when the active dataset dictionary changes: the dataset name and the list of
+    variable names.
+
+    Any rename, insertion, deletion or reordering of variables changes it.  Reading it takes one
+    spss.GetVariableName call per variable."""
+
+    try:
+        dsname = spss.ActiveDataset()
+    except:
+        dsname = None
+    return dsname, [spss.GetVariableName(i) for i in xrange(spss.GetVariableCount())]
+
+def getvariableindex():
+    """Return the VariableIndex for the active dataset, building it only if the dictionary has changed.
+
+    The names are read and compared with those the index was built from on every call.  The index also has a
+    fingerprint, a digest of its dictionarytoken value, which datasetfingerprint uses."""
+
+    import hashlib
+    token = dictionarytoken()
+    index, indextoken = _activeindex
+    if index is None or indextoken != token:
+        index = VariableIndex(token[1])
+        index.fingerprint = hashlib.sha1(repr(token)).hexdigest()
+        _activeindex[:] = [index, token]
+    _checkedindex.index = index
+    return index
+
+def invalidatevariableindex():
+    """Discard the cached VariableIndex so that the next getvariableindex call rebuilds it"""
+
+    _activeindex[:] = [None, None]
+    _checkedindex.index = None
+
+class CaseReader(object):
+    """Read the active dataset in blocks of cases for the variables of a parsed variable list.
+
+    varlist is the value of an existingvarlist or varname parameter: a list of names, a LazyVarlist or a blank-
+    separated string.  TO and ALL are expanded and the names are checked with the VariableIndex for the active
+    dataset.  The variable types are found once, here, so each block is converted a column at a time without
+    examining the values.
+
+    Iterating over the reader, or over blocks(), reads blocksize cases at a time with a single cursor and yields a
+    CaseBlock for each, so the memory used does not depend on the number of cases.  The cursor is closed when the
+    cases are exhausted, when the iteration is abandoned and the generator closed, or by close.
+    usermissing, if True, returns user-missing values as valid values instead of as missing.
+
+    Typical use in an implementation:
+        for block in CaseReader(variables):
+            for name, values, missing in zip(block.numericnames, block.numeric, block.missing):
+                ..."""
+
+    def __init__(self, varlist, blocksize=10000, usermissing=False):
+        index = getvariableindex()
+        tokens = None
+        if isinstance(varlist, LazyVarlist):   # expanded directly to positions
+            tokens = varlist.tokens
+        elif isinstance(varlist, basestring):
+            tokens = varlist
+        if tokens is None:
+            self.positions = [index.position(name) for name in varlist]
+        else:
+            self.positions = [p for start, end in index.spans(tokens) for p in xrange(start, end)]
+        if not self.positions:   # a cursor without variables would read all of them
+            raise ValueError(_("No variables were specified"))
+        self.names = [index.names[p] for p in self.positions]
+        self.blocksize = blocksize
+        self.usermissing = usermissing
+        types = [spss.GetVariableType(p) for p in self.positions]   # 0 for numeric, otherwise the string width
+        self.numericcols = [j for j, vartype in enumerate(types) if vartype == 0]
+        self.stringcols = [j for j, vartype in enumerate(types) if vartype != 0]
+        self.numericnames = [self.names[j] for j in self.numericcols]
+        self.stringnames = [self.names[j] for j in self.stringcols]
+        try:
+            import numpy
+            self.numpy = numpy
+        except ImportError:
+            self.numpy = None
+        self.cursor = None
+        self.casesread = 0
+
+    def __iter__(self):
+        return self.blocks()
+
+    def blocks(self):
+        """Generate a CaseBlock for each blocksize cases of the active dataset"""
+
+        self.close()
+        cursor = self.cursor = spss.Cursor(self.positions, accessType="r")
+        try:
+            if self.usermissing:
+                cursor.SetUserMissingInclude(True)
+            self.casesread = 0
+            while True:
+                rows = cursor.fetchmany(self.blocksize)
+                if not rows:
+                    break
+                block = CaseBlock(self, self.casesread, rows)
+                self.casesread += block.ncases
+                yield block
+        finally:
+            if self.cursor is cursor:
+                self.close()
+
+    def close(self):
+        """Close the cursor if the cases are being read"""
+
+        if self.cursor is not None:
+            cursor, self.cursor = self.cursor, None
+            cursor.close()
+
+class CaseBlock(object):
+    """A block of consecutive cases read by a CaseReader.
+
+    start is the number of cases before the block and ncases the number in it.
+    numeric[j] holds the values of the numeric variable numericnames[j] and missing[j] is True where those values
+    are missing, which makes them NaN in numeric.  strings[j] holds the values of the string variable
+    stringnames[j].  With NumPy, numeric is a float64 array, missing a bool array and strings an object array,
+    each with one row per variable and one column per case.  Without it, they are lists with an array.array("d"),
+    a list of bools and a list of strings for each variable."""
+
+    __slots__ = ["start", "ncases", "numericnames", "stringnames", "numeric", "missing", "strings"]
+
+    def __init__(self, reader, start, rows):
+        self.start = start
+        self.ncases = n = len(rows)
+        self.numericnames = reader.numericnames
+        self.stringnames = reader.stringnames
+        numpy = reader.numpy
+        columns = zip(*rows)
+        if numpy is not None:
+            self.numeric = numpy.empty((len(reader.numericcols), n), dtype=numpy.float64)
+            self.missing = numpy.zeros((len(reader.numericcols), n), dtype=bool)
+            self.strings = numpy.empty((len(reader.stringcols), n), dtype=object)
+        else:
+            self.numeric, self.missing, self.strings = [], [], []
+        nan = float("nan")
+        for k, j in enumerate(reader.numericcols):
+            values, missing = columns[j], None
+            if None in values:
+                missing = [v is None for v in values]
+                values = [nan if v is None else v for v in values]
+            if numpy is not None:
+                self.numeric[k] = values
+                if missing is not None:
+                    self.missing[k] = missing
+            else:
+                self.numeric.append(array.array("d", values))
+                self.missing.append(missing or [False] * n)
+        for k, j in enumerate(reader.stringcols):
+            if numpy is not None:
+                self.strings[k] = columns[j]
+            else:
+                self.strings.append(list(columns[j]))
+
+    def column(self, name):
+        """Return the values of the variable name, which must be exactly as in the reader's names"""
+
+        if name in self.numericnames:
+            return self.numeric[self.numericnames.index(name)]
+        if name in self.stringnames:
+            return self.strings[self.stringnames.index(name)]
+        raise ValueError(_("Invalid variable name: %s") % name)
+
 def checkrequiredparams(implementingfunc, params, exclude=None):
     """Check that all required parameters were supplied.  Raise exception if not
 
@@ -333,16 +1164,58 @@ def checkrequiredparams(implementingfunc, params, exclude=None):
     params is the parsed argument specification as returned by extension.Syntax.parsecmd
     exclude is an optional list of arguments to be ignored in this check.  Typically it would include self for a class."""
 
-    args, junk, junk, deflts = inspect.getargspec(implementingfunc)
-    if not exclude is None:
-        for item in exclude:
-            args.remove(item)
-    args = set(args[: len(args) - len(deflts)])    # the required arguments
-    omitted = args - set(params)
+    omitted = requiredparams(implementingfunc, exclude).difference(params)
     if omitted:
         raise ValueError(_("The following required parameters were not supplied:\n") + ", ".join(omitted))
 
-def processcmd(oobj, args, f, excludedargs=None, lastchancef = None, vardict=None):
+# frozensets of required parameter names for each implementing function and exclusion tuple
+_requiredcache = weakref.WeakKeyDictionary()
+
+def requiredparams(f, exclude=None):
+    """Return the frozenset of parameters that must be supplied in order to call f with keyword arguments.
+
+    f is the implementing function or method.  For a method, self is included unless excluded.
+    exclude is an optional sequence of parameter names to leave out.  Each must be a parameter of f.
+    The result is computed once per function and exclusion list."""
+
+    func = getattr(f, "__func__", f)   # cache methods by their underlying function
+    exclude = exclude and tuple(exclude) or ()
+    try:
+        byexclude = _requiredcache.get(func)
+    except TypeError:   # not weakly referenceable
+        return _findrequired(func, exclude)
+    if byexclude is None:
+        byexclude = _requiredcache[func] = {}
+    try:
+        return byexclude[exclude]
+    except KeyError:
+        required = byexclude[exclude] = _findrequired(func, exclude)
+        return required
+
+def _findrequired(func, exclude):
+    """Return the required parameters of func less those in exclude.
+
+    inspect.signature is used where available so that keyword-only parameters are included."""
+
+    import inspect
+    if hasattr(inspect, "signature"):
+        names = []
+        required = set()
+        for p in inspect.signature(func, follow_wrapped=False).parameters.values():
+            if p.kind in (p.POSITIONAL_OR_KEYWORD, p.KEYWORD_ONLY):
+                names.append(p.name)
+                if p.default is p.empty:
+                    required.add(p.name)
+    else:
+        names, junk, junk, deflts = inspect.getargspec(func)
+        required = set(names[: len(names) - len(deflts or ())])
+    for item in exclude:
+        if not item in names:
+            raise ValueError(_("Excluded argument is not a parameter of the implementing function: %s") % item)
+        required.discard(item)
+    return frozenset(required)
+
+def processcmd(oobj, args, f, excludedargs=None, lastchancef = None, vardict=None, processpool=False, memoize=False):
     """Parse arguments and execute implementation function.
 
     oobj is the Syntax object for the command.
@@ -354,7 +1227,12 @@ def processcmd(oobj, args, f, excludedargs=None, lastchancef = None, vardict=Non
     lastchancef is an optional function that will be called just before executing the command and passed
     the parsed parameters object
     Typically it would include self for a class.
-    vardict, if supplied, is passed to the parser for variable validation"""
+    vardict, if supplied, is passed to the parser for variable validation
+    processpool, if True, runs f in the session process pool instead of in this process.  This also happens
+    if f is decorated with inprocesspool.  f must then be picklable, i.e., defined at module level,
+    and must not use the spss module.  Parsing, checking and all output still happen in this process.
+    memoize, if True, reuses the result and output of an earlier call of f with the same parameters on the same
+    active dataset.  This also happens if f is decorated with memoize.  See memoize."""
 
 
     ##debugging
@@ -368,49 +1246,1621 @@ def processcmd(oobj, args, f, excludedargs=None, lastchancef = None, vardict=Non
     #except:
         #pass
     
+    if timingenabled:
+        cmdstart = _timer()
+    if tracer is not None:
+        tracestart = _timer()
+        context, outcome, failed = None, "ok", None
+    profile = None
+    if memoryprofiler is not None:
+        profile = memoryprofiler.begin(oobj.cmdname)
     try:
-        oobj.parsecmd(args, vardict=vardict)
-        # check for missing required parameters
-        args, junk, junk, deflts = inspect.getargspec(f)
-        if deflts is None:   #getargspec definition seems pretty dumb here
-            deflts = tuple()
-        if not excludedargs is None:
-            for item in excludedargs:
-                args.remove(item)
-        args = set(args[: len(args) - len(deflts)])    # the required arguments
-        omitted = [item for item in args if not item in oobj.parsedparams]
-        if omitted:
-            raise ValueError, _("The following required parameters were not supplied:\n") + ", ".join(omitted)
-        if not lastchancef is None:
-            lastchancef(oobj.parsedparams)
-        return f(**oobj.parsedparams)
+        context = _preparecmd(oobj, args, f, excludedargs, lastchancef, vardict, profile)
+        params = context.parsedparams
+        if timingenabled:
+            start = _timer()
+        if memoize or getattr(f, "memoize", False):
+            result = _memoizedcall(oobj, f, params, lambda: _callimplementation(f, params, processpool), vardict)
+        else:
+            result = _callimplementation(f, params, processpool)
+        if timingenabled:
+            _lap(oobj.cmdname, "implementation", start)
+        if profile is not None:
+            profile.lap("implementation")
+        return result
     except:
-        # Exception messages are printed here as a pivot table, 
-        # but the exception is not propagated, and tracebacks are suppressed,
-        # because as an Extension command, the Python handling should be suppressed.
-        
-        # But, if the SPSS_EXTENSIONS_RAISE environment variable exists and has the value "true"
-        # the exception is reraised instead.
+        if tracer is not None:
+            outcome = sys.exc_info()[0].__name__
+            if context is None:
+                failed = "parse"
+            else:
+                failed = "implementation"
+        _reportfailure(oobj, profile)
+    finally:
+        _checkedindex.index = None   # the dictionary may change before the next command
+        if warningcollector is not None:
+            warningcollector.commanddone()
+        if profile is not None:
+            profile.end()
+        if timingenabled:
+            _lap(oobj.cmdname, "total", cmdstart)
+        if tracer is not None:
+            tracer.record(oobj, args, vardict, context and context.digest, outcome, _timer() - tracestart, failed)
+
+def _callimplementation(f, params, processpool):
+    if processpool or getattr(f, "inprocesspool", False):
+        # a worker exception is raised again here by result()
+        return getprocesspool().submit(f, **params).result()
+    return f(**params)
+
+def _reportfailure(oobj, profile=None):
+    """Report the exception being handled as processcmd does, timing the report and measuring its memory"""
+
+    if timingenabled:
+        start = _timer()
+    if profile is not None:   # the failed phase is counted only in the total
+        profile.skip()
+    try:
+        reportexception(oobj)
+    finally:
+        if timingenabled:
+            _lap(oobj.cmdname, "error report", start)
+        if profile is not None:
+            profile.lap("error report")
+
+def _preparecmd(oobj, args, f, excludedargs, lastchancef, vardict, profile=None):
+    """Parse args, check for missing required parameters and call lastchancef, as processcmd does before calling f.
+
+    profile is the _CommandMemory, if any, measuring the command.  Return the ParseContext."""
+
+    if timingenabled:
+        start = _timer()
+    context = oobj.parsecmd(args, vardict=vardict)
+    if timingenabled:
+        start = _lap(oobj.cmdname, "parse", start)
+    if profile is not None:
+        profile.lap("parse")
+    if tracer is not None:   # before lastchancef or the implementation can change the parameters
+        context.digest = paramsdigest(context.parsedparams)
+    # check for missing required parameters
+    omitted = requiredparams(f, excludedargs).difference(context.parsedparams)
+    if timingenabled:
+        start = _lap(oobj.cmdname, "required check", start)
+    if omitted:
+        raise ValueError, _("The following required parameters were not supplied:\n") + ", ".join(omitted)
+    if not lastchancef is None:
+        lastchancef(context.parsedparams)
+        if timingenabled:
+            _lap(oobj.cmdname, "lastchancef", start)
+    if profile is not None:
+        profile.lap("check")
+    return context
+
+def reportexception(oobj):
+    """Report the exception being handled for the command with Syntax object oobj.  Call only from an except clause.
+
+    The message is produced as a Warnings pivot table or added to the active warning collector."""
+
+    # Exception messages are printed here as a pivot table, 
+    # but the exception is not propagated, and tracebacks are suppressed,
+    # because as an Extension command, the Python handling should be suppressed.
+    
+    # But, if the SPSS_EXTENSIONS_RAISE environment variable exists and has the value "true"
+    # the exception is reraised instead.
 
-        ###raise   #debug
-        if 'SPSS_EXTENSIONS_RAISE' in os.environ and os.environ['SPSS_EXTENSIONS_RAISE'].lower() == "true":
-            raise
-        else:
-            myenc = locale.getlocale()[1]  # get current encoding in case conversions needed        
+    ###raise   #debug
+    if 'SPSS_EXTENSIONS_RAISE' in os.environ and os.environ['SPSS_EXTENSIONS_RAISE'].lower() == "true":
+        raise
+    else:
+        msg = exceptionmessage()
+        if warningcollector is None:
             warnings = NonProcPivotTable("Warnings",tabletitle=_("Warnings "))
-            msg = sys.exc_info()[1]
-            if _isseq(msg):
-                # try to make error message into something a pivot table will understand
-                # avoid forcing a str conversion if possible, but numbers and classes need
-                # to be converted
-                #msg = ",".join([(isinstance(item, (float, int)) or item is None) and str(item) or \
-                    #(isinstance(item, Exception) and str(item)) or item for item in msg])
-                msg = ",".join([unicodeit(item, myenc) for item in msg])
-            if len(msg) == 0:   # no message with exception
-                msg = str(sys.exc_info()[0])  # if no message, use the type of the exception (ugly)
             warnings.addrow(msg)
             sys.exc_clear()
             warnings.generate()
+        else:
+            warningcollector.add(getattr(oobj, "cmdname", ""), sys.exc_info()[0], msg)
+            sys.exc_clear()
+
+def processcmds(oobj, argslist, f, excludedargs=None, lastchancef=None, vardict=None, memoize=False, threads=None):
+    """Parse a batch of commands and run f for all of them in the session process pool or in threads.
+
+    argslist is a sequence of args values as would be passed to processcmd.  The other arguments are as for processcmd.
+    The commands are parsed and checked in this process in order, and the implementation calls are then
+    spread across the pool.  Return a list with the result of f for each command or None for a command that failed.
+    Failures are reported as processcmd reports them.
+
+    Each command is timed, traced, profiled, memoized and counted by the warning collector as in processcmd, with
+    these differences, which follow from f running concurrently in other processes.  The implementation time of a
+    command runs from its submission to the collection of its result, and its total time ends at that collection.
+    The memory profile covers the parse and check phases and the report of a failure in them, but not the
+    implementation.  A memoized result is looked up before f is submitted, so a hit is not sent to the pool, and
+    there is no output to record, since f cannot use the spss module.
+
+    threads, if not None, is the number of implementation calls to run at a time in threads of this process instead
+    of in the process pool.  This suits implementations that spend their time waiting on I/O, such as reading side
+    files or querying a database, which then overlap.  f need not be picklable, but it must still not produce output
+    or submit commands, since the calls run concurrently; the parsing, the results and the failure reports stay in
+    the calling thread and in order."""
+
+    if threads is None:
+        pool = getprocesspool()
+    else:
+        pool = _ThreadExecutor(threads)
+    memoize = memoize or getattr(f, "memoize", False)
+    try:
+        pending = [_submitcmd(oobj, args, f, excludedargs, lastchancef, vardict, memoize, pool) for args in argslist]
+        return [_finishcmd(oobj, vardict, cmd) for cmd in pending]
+    finally:
+        _checkedindex.index = None   # the dictionary may change before the next command
+
+class _BatchCommand(object):
+    """A command of processcmds from its submission until its result is collected"""
+
+    def __init__(self, args):
+        self.args = args
+        self.start = _timer()
+        self.implstart = None
+        self.context = None
+        self.outcome = "ok"
+        self.failed = None   # the phase that failed, for the trace
+        self.future = None
+        self.key = None   # the result cache key if the result is to be memoized
+        self.result = None
+
+def _submitcmd(oobj, args, f, excludedargs, lastchancef, vardict, memoize, pool):
+    """Prepare a command of processcmds and submit f for it unless its result is memoized.  Return a _BatchCommand"""
+
+    cmd = _BatchCommand(args)
+    profile = None
+    if memoryprofiler is not None:
+        profile = memoryprofiler.begin(oobj.cmdname)
+    try:
+        try:
+            cmd.context = _preparecmd(oobj, args, f, excludedargs, lastchancef, vardict, profile)
+            params = cmd.context.parsedparams
+            cmd.implstart = _timer()
+            if memoize:
+                cmd.key = _memoizedkey(oobj, f, params, vardict)
+            if cmd.key is not None:
+                entry = _memoizedentry(cmd.key)
+                if entry is not None:
+                    _OutputRecorder.replay(entry[1])
+                    cmd.result, cmd.key = entry[0], None
+                    if timingenabled:
+                        _lap(oobj.cmdname, "implementation", cmd.implstart)
+                    return cmd
+            cmd.future = pool.submit(f, **params)
+        except:
+            cmd.outcome, cmd.failed = sys.exc_info()[0].__name__, "parse"
+            _reportfailure(oobj, profile)
+    finally:
+        if profile is not None:
+            profile.end()
+    return cmd
+
+def _finishcmd(oobj, vardict, cmd):
+    """Collect the result of a command of processcmds and finish its bookkeeping.  Return the result or None"""
+
+    try:
+        if cmd.future is not None:
+            try:
+                cmd.result = cmd.future.result()   # a worker exception is raised again here
+                if timingenabled:
+                    _lap(oobj.cmdname, "implementation", cmd.implstart)
+                if cmd.key is not None:
+                    _memoizeresult(cmd.key, (cmd.result, []))
+            except:
+                cmd.result, cmd.outcome, cmd.failed = None, sys.exc_info()[0].__name__, "implementation"
+                _reportfailure(oobj)
+        return cmd.result
+    finally:
+        if warningcollector is not None:
+            warningcollector.commanddone()
+        if timingenabled:
+            _lap(oobj.cmdname, "total", cmd.start)
+        if tracer is not None:
+            tracer.record(oobj, cmd.args, vardict, cmd.context and cmd.context.digest, cmd.outcome,
+                _timer() - cmd.start, cmd.failed)
+
+def inprocesspool(f):
+    """Decorator marking an implementation function to be run in the session process pool by processcmd"""
+
+    f.inprocesspool = True
+    return f
+
+# The process pool is created on first use and kept for the session.
+# processpoolworkers is the number of worker processes; None means one per CPU.
+# processpoolexecutable is the Python interpreter for the workers.  Set it if sys.executable is not Python,
+# as in some products.
+processpoolworkers = None
+processpoolexecutable = sys.executable
+_processpool = []
+
+def getprocesspool():
+    """Return the session process pool, creating it if necessary.
+
+    Each worker is a fresh interpreter started with processpoolexecutable, not a fork of this process, which
+    would inherit the session.  submit(f, *args, **kwargs) returns an object whose result() method returns
+    the value of f or raises its exception.  f, its arguments and its value must be picklable, and f must be
+    importable in the workers, which get the sys.path of this process."""
+
+    if not _processpool:
+        _processpool.append(_InterpreterPool(processpoolworkers))
+    return _processpool[0]
+
+def shutdownprocesspool():
+    """Stop the worker processes of the session process pool, if it exists"""
+
+    if _processpool:
+        _processpool.pop().shutdown()
+
+def _startinterpreter(executable, main):
+    """Start executable running function main of extensionclient and return (process, connection).
+
+    The connection sends to the standard input of the process and receives from its standard output."""
+
+    import subprocess
+    from extensionclient import PipeConnection
+    code = "import sys; sys.path.insert(0, %r); import extensionclient; extensionclient.%s()" % (
+        os.path.dirname(os.path.abspath(__file__)), main)
+    # a fresh interpreter rather than a fork, which would inherit this session
+    process = subprocess.Popen([executable, "-c", code], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+        close_fds=sys.platform != "win32")
+    return process, PipeConnection(process.stdout, process.stdin)
+
+class _InterpreterPool(object):
+    """Run submitted calls in worker interpreters, one call at a time in each.  See extensionclient.poolworkermain"""
+
+    def __init__(self, workers=None):
+        import Queue, atexit, multiprocessing
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        self.idle = Queue.Queue()
+        self.workers = []
+        for i in range(workers):
+            self.idle.put(self._startworker())
+        atexit.register(self.shutdown)
+
+    def _startworker(self):
+        worker = _startinterpreter(processpoolexecutable, "poolworkermain")
+        self.workers.append(worker)
+        try:
+            worker[1].send(sys.path)
+        except (IOError, OSError):
+            pass   # the worker has already stopped, which the first call to it reports
+        return worker
+
+    def submit(self, f, *args, **kwargs):
+        future = _ThreadFuture()
+        thread = threading.Thread(target=self._wait, args=(future, f, args, kwargs))
+        thread.daemon = True
+        thread.start()
+        return future
+
+    def _wait(self, future, f, args, kwargs):
+        try:
+            try:
+                future.value = self._call(f, args, kwargs)
+            except:
+                future.error = sys.exc_info()
+        finally:
+            future.done.set()
+
+    def _call(self, f, args, kwargs):
+        """Run f in an idle worker and return its value or raise its exception.
+
+        The call and the reply are pickled separately, so one that cannot be pickled or unpickled
+        does not leave the rest of a message in the pipe."""
+
+        import cPickle
+        request = ("call", cPickle.dumps((f, args, kwargs), 2))
+        worker = self.idle.get()
+        try:
+            worker[1].send(request)
+            reply = worker[1].recv()
+        except (EOFError, IOError, OSError):
+            # the worker died, perhaps in f, so it is replaced
+            self._retire(worker)
+            worker = self._startworker()
+            raise RuntimeError(_("The worker process stopped while running the command"))
+        finally:
+            self.idle.put(worker)
+        if reply[0] == "ok":
+            return cPickle.loads(reply[1])
+        try:
+            error = cPickle.loads(reply[3])
+        except Exception:   # including an exception that was not pickled
+            error = RuntimeError("%s: %s" % reply[1:3])
+        raise error
+
+    def _retire(self, worker):
+        if worker in self.workers:
+            self.workers.remove(worker)
+        worker[1].close()
+        if worker[0].poll() is None:
+            worker[0].terminate()
+        worker[0].wait()
+
+    def shutdown(self, wait=True):
+        while self.workers:
+            process, conn = self.workers.pop()
+            conn.close()   # the worker stops at the end of its input
+            if wait:
+                process.wait()
+
+class _ThreadExecutor(object):
+    """Run each submitted call in a thread of its own, with at most limit calls running at a time.
+
+    submit waits for a free slot, so a long batch does not start all its threads at once."""
+
+    def __init__(self, limit):
+        self.slots = threading.BoundedSemaphore(limit)
+
+    def submit(self, f, *args, **kwargs):
+        future = _ThreadFuture()
+        self.slots.acquire()
+        try:
+            thread = threading.Thread(target=self._run, args=(future, f, args, kwargs))
+            thread.daemon = True
+            thread.start()
+        except:
+            self.slots.release()
+            raise
+        return future
+
+    def _run(self, future, f, args, kwargs):
+        try:
+            try:
+                future.value = f(*args, **kwargs)
+            except:
+                future.error = sys.exc_info()
+        finally:
+            self.slots.release()
+            future.done.set()
+
+class _ThreadFuture(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+    def result(self, timeout=None):
+        if not self.done.wait(timeout):
+            raise RuntimeError(_("The command did not finish in time"))
+        if self.error is not None:
+            raise self.error[0], self.error[1], self.error[2]
+        return self.value
+
+def memoize(f):
+    """Decorator marking an implementation function whose results processcmd may reuse.
+
+    f must be a pure report: its result and output must depend only on its parameters and the active dataset.
+    The first call with given parameters on a given dataset runs f and records the result and the output that f
+    produces through the spss module: procedures, pivot tables and text blocks.  A later call with the same
+    parameters, while datasetfingerprint is unchanged, skips f and produces the recorded output again.
+    The same result object is returned each time.  A call in which f uses spss.Submit is not recorded, because
+    its output cannot be reproduced.  Only the output of the thread running f is recorded, and memoized commands in
+    other threads are not held up while f runs.
+
+    If the vardict of the command comes from getvariableindex, the fingerprint uses the names it read, so they are
+    read once per command.  The dataset fingerprint does not notice a change to the data values that keeps the dictionary and the number of
+    cases, such as a COMPUTE into an existing variable.  Call invalidateresults after such a change."""
+
+    f.memoize = True
+    return f
+
+# Memoized results are kept for the session, dropping the least recently used when there are more than
+# resultcachesize.  If resultcachedir names a directory, which the SPSS_EXTENSIONS_RESULTCACHE environment variable
+# can set, results are also written there, up to resultcachedisksize files, so they survive the session.
+resultcachesize = 32
+resultcachedir = os.environ.get("SPSS_EXTENSIONS_RESULTCACHE") or None
+resultcachedisksize = 256
+_resultcache = OrderedDict()
+_resultlock = threading.RLock()
+resultstats = {"hits": 0, "diskhits": 0, "misses": 0, "evictions": 0, "uncacheable": 0}
+
+def resultcachestats():
+    """Return a copy of the result cache counters with the current size added"""
+
+    stats = dict(resultstats)
+    stats["size"] = len(_resultcache)
+    return stats
+
+def invalidateresults(f=None):
+    """Discard the memoized results of implementation function f or, if f is None, all of them, in memory and on disk"""
+
+    prefix = f is not None and _functionkey(f) or ""
+    _resultlock.acquire()
+    try:
+        for key in [k for k in _resultcache if k.startswith(prefix)]:
+            del _resultcache[key]
+        if resultcachedir and os.path.isdir(resultcachedir):
+            for name in os.listdir(resultcachedir):
+                if name.startswith(prefix) and name.endswith(".pickle"):
+                    os.remove(os.path.join(resultcachedir, name))
+    finally:
+        _resultlock.release()
+
+def datasetfingerprint(vardict=None):
+    """Return a digest of the active dataset name, case count and variable names, or None if the case count is not known.
+
+    The dictionary part is the fingerprint of the VariableIndex from getvariableindex, so the parse cache and the
+    result cache notice the same dictionary changes.  If vardict is the index that getvariableindex returned in this
+    thread during the current command, its names were just checked and are not read again; otherwise
+    getvariableindex is called, which reads them all."""
+
+    import hashlib
+    cases = spss.GetCaseCount()
+    if cases < 0:
+        return None
+    if vardict is None or vardict is not getattr(_checkedindex, "index", None):
+        vardict = getvariableindex()
+    return hashlib.sha1(repr((cases, vardict.fingerprint))).hexdigest()
+
+def _functionkey(f):
+    import hashlib
+    name = "%s.%s" % (getattr(f, "__module__", ""), getattr(f, "__name__", f.__class__.__name__))
+    return hashlib.sha1(name).hexdigest()[:8] + "-"
+
+def _memoizedcall(oobj, f, params, run, vardict=None):
+    """Return the memoized result of f for params, replaying its output, or call run and memoize what it returns.
+
+    vardict is the vardict of the command, which datasetfingerprint may use instead of reading the names."""
+
+    key = _memoizedkey(oobj, f, params, vardict)
+    if key is None:
+        return run()
+    entry = _memoizedentry(key)
+    if entry is not None:
+        _OutputRecorder.replay(entry[1])
+        return entry[0]
+    # the implementation runs without the lock, so memoized commands in other threads are not held up
+    recorder = _OutputRecorder()
+    recorder.start()
+    try:
+        result = run()
+    finally:
+        recorder.stop()
+    if not recorder.complete:
+        _resultlock.acquire()
+        resultstats["uncacheable"] += 1
+        _resultlock.release()
+        return result
+    _memoizeresult(key, (result, recorder.calls))
+    return result
+
+def _memoizedkey(oobj, f, params, vardict=None):
+    """Return the result cache key for f with params on the active dataset, or None if the call cannot be memoized"""
+
+    digest = paramsdigest(params)
+    fingerprint = digest and datasetfingerprint(vardict)
+    # a memoized command run by another one being recorded is part of that one's output
+    if fingerprint is None or _OutputRecorder.current() is not None:
+        _resultlock.acquire()
+        resultstats["uncacheable"] += 1
+        _resultlock.release()
+        return None
+    import hashlib
+    return _functionkey(f) + hashlib.sha1(repr((oobj.signature, digest, fingerprint))).hexdigest()[:24]
+
+def _memoizedentry(key):
+    """Return the (result, output calls) entry for key from memory or disk, or None, counting a hit or a miss"""
+
+    _resultlock.acquire()
+    try:
+        entry = _resultcache.pop(key, None)
+        if entry is None and resultcachedir:
+            entry = _readresult(key)
+            if entry is not None:
+                resultstats["diskhits"] += 1
+        if entry is not None:
+            resultstats["hits"] += 1
+            _resultcache[key] = entry   # reinsert as most recently used
+        else:
+            resultstats["misses"] += 1
+        return entry
+    finally:
+        _resultlock.release()
+
+def _memoizeresult(key, entry):
+    """Add the (result, output calls) entry for key to the result cache"""
+
+    _resultlock.acquire()
+    try:
+        _resultcache[key] = entry
+        while len(_resultcache) > resultcachesize:
+            _resultcache.popitem(last=False)
+            resultstats["evictions"] += 1
+        if resultcachedir:
+            _writeresult(key, entry)
+    finally:
+        _resultlock.release()
+
+def _readresult(key):
+    import cPickle
+    _picklecelltext()
+    try:
+        fp = open(os.path.join(resultcachedir, key + ".pickle"), "rb")
+    except IOError:
+        return None
+    try:
+        try:
+            return cPickle.load(fp)
+        except Exception:
+            return None   # written by an incompatible version; it will be replaced
+    finally:
+        fp.close()
+
+def _writeresult(key, entry):
+    """Write entry to the disk cache if it can be pickled and drop the oldest files beyond resultcachedisksize"""
+
+    import cPickle
+    _picklecelltext()
+    try:
+        data = cPickle.dumps(entry, 2)
+    except Exception:
+        return   # e.g., an unpicklable result, which is only kept in memory
+    if not os.path.isdir(resultcachedir):
+        os.makedirs(resultcachedir)
+    filespec = os.path.join(resultcachedir, key + ".pickle")
+    fp = open(filespec + ".tmp", "wb")
+    try:
+        fp.write(data)
+    finally:
+        fp.close()
+    if os.path.exists(filespec):
+        os.remove(filespec)
+    os.rename(filespec + ".tmp", filespec)
+    files = [os.path.join(resultcachedir, name) for name in os.listdir(resultcachedir) if name.endswith(".pickle")]
+    if len(files) > resultcachedisksize:
+        files.sort(key=os.path.getmtime)
+        for filespec in files[:len(files) - resultcachedisksize]:
+            os.remove(filespec)
+
+def _picklecelltext():
+    """Register a way to pickle the CellText classes, which pickle cannot find by name because they are nested"""
+
+    import copy_reg
+    for name in dir(spss.CellText):
+        cls = getattr(spss.CellText, name)
+        if isinstance(cls, type) and not cls in copy_reg.dispatch_table:
+            copy_reg.pickle(cls, _reducecelltext)
+
+def _reducecelltext(obj):
+    return _makecelltext, (obj.__class__.__name__, obj.__dict__)
+
+def _makecelltext(name, state):
+    cls = getattr(spss.CellText, name)
+    obj = cls.__new__(cls)
+    obj.__dict__.update(state)
+    return obj
+
+class _OutputRecorder(object):
+    """Record the output calls that an implementation makes through the spss module so that they can be replayed.
+
+    Only the calls made in the thread that started the recorder are recorded.  While any thread is recording, the
+    spss functions are replaced by dispatchers that pass the calls of other threads straight through, and the
+    spss classes by recording subclasses.  An instance of a recording subclass is a real table or text block,
+    which records its construction and method calls only if it was created in a recording thread, and isinstance
+    and issubclass treat the subclass as the class it stands for, so checks against spss.BasePivotTable keep
+    working in every thread.  An instance of another subclass created while recording cannot be reproduced, so
+    it makes the recording incomplete.
+
+    calls is a list of (target, name, args, kwargs).  target is None for a function of the spss module or
+    the index of the call that returned the object, such as a pivot table, whose method was called.  An argument
+    that was returned by an earlier call, such as a Dimension, is recorded as _RecordedRef(index of that call),
+    and a CellText class as _RecordedCellType(class name)."""
+
+    functions = ("StartProcedure", "EndProcedure", "BasePivotTable", "TextBlock")
+    unrecordable = ("Submit",)
+    saved = {}   # name -> the spss function or class replaced by a dispatcher or recording subclass
+    classes = {}   # spss class -> its recording subclass
+    recording = 0   # the number of recorders started and not stopped
+    lock = threading.Lock()
+    local = threading.local()
+
+    def __init__(self):
+        self.calls = []
+        self.returned = {}   # id of an object returned by a call -> index of the call
+        self.keep = []   # the returned objects, so that their ids stay valid
+        self.complete = True
+        self.depth = 0   # while a recorded call is running, the calls it makes itself are not recorded
+
+    @classmethod
+    def current(cls):
+        """Return the recorder of the calling thread, or None"""
+
+        return getattr(cls.local, "recorder", None)
+
+    def start(self):
+        cls = _OutputRecorder
+        cls.lock.acquire()
+        try:
+            if cls.recording == 0:
+                for name in self.functions + self.unrecordable:
+                    if hasattr(spss, name):
+                        func = cls.saved[name] = getattr(spss, name)
+                        if isinstance(func, type):
+                            setattr(spss, name, cls._recordingclass(name, func))
+                        else:
+                            setattr(spss, name, cls._dispatcher(name, func))
+            cls.recording += 1
+        finally:
+            cls.lock.release()
+        cls.local.recorder = self
+
+    def stop(self):
+        cls = _OutputRecorder
+        cls.local.recorder = None
+        cls.lock.acquire()
+        try:
+            cls.recording -= 1
+            if cls.recording == 0:
+                for name, func in cls.saved.iteritems():
+                    setattr(spss, name, func)
+                cls.saved.clear()
+        finally:
+            cls.lock.release()
+        self.returned = {}
+        self.keep = []
+
+    @classmethod
+    def _dispatcher(cls, name, func):
+        def dispatch(*args, **kwargs):
+            recorder = getattr(cls.local, "recorder", None)
+            if recorder is None:
+                return func(*args, **kwargs)
+            return recorder._wrap(None, name, func)(*args, **kwargs)
+        return dispatch
+
+    @classmethod
+    def _recordingclass(cls, name, real):
+        """Return the recording subclass of the spss class real, which is spss.name"""
+
+        sub = cls.classes.get(real)
+        if sub is not None:
+            return sub
+        local = cls.local
+
+        def __instancecheck__(klass, obj):
+            if klass.__dict__.get("_realclass") is None:   # a subclass of the recording subclass
+                return type(real).__instancecheck__(klass, obj)
+            return isinstance(obj, klass._realclass)
+
+        def __subclasscheck__(klass, other):
+            if klass.__dict__.get("_realclass") is None:
+                return type(real).__subclasscheck__(klass, other)
+            return issubclass(other, klass._realclass)
+
+        def __init__(self, *args, **kwargs):
+            recorder = getattr(local, "recorder", None)
+            if recorder is None or recorder.depth:
+                real.__init__(self, *args, **kwargs)
+                return
+            recorder.depth += 1
+            try:
+                real.__init__(self, *args, **kwargs)
+            finally:
+                recorder.depth -= 1
+            if type(self) is sub:
+                recorder._created(name, self, args, kwargs)
+            else:
+                recorder.complete = False
+
+        def __getattribute__(self, attr):
+            value = real.__getattribute__(self, attr)
+            if attr.startswith("_") or not callable(value):
+                return value
+            recorder = getattr(local, "recorder", None)
+            if recorder is None or not id(self) in recorder.returned:
+                return value
+            return recorder._wrap(recorder.returned[id(self)], attr, value)
+
+        def __setitem__(self, key, value):
+            recorder = getattr(local, "recorder", None)
+            if recorder is None or not id(self) in recorder.returned:
+                return real.__setitem__(self, key, value)
+            recorder._wrap(recorder.returned[id(self)], "__setitem__",
+                lambda key, value: real.__setitem__(self, key, value))(key, value)
+
+        meta = type("_Recording" + type(real).__name__, (type(real),),
+            {"__instancecheck__": __instancecheck__, "__subclasscheck__": __subclasscheck__})
+        namespace = {"_realclass": real, "__init__": __init__, "__getattribute__": __getattribute__,
+            "__module__": real.__module__, "__doc__": real.__doc__}
+        if hasattr(real, "__setitem__"):
+            namespace["__setitem__"] = __setitem__
+        sub = cls.classes[real] = meta(real.__name__, (real,), namespace)
+        return sub
+
+    def _created(self, name, obj, args, kwargs):
+        """Record the construction of obj by the spss class name"""
+
+        index = len(self.calls)
+        self.calls.append((None, name, self._refs(args), dict((k, self._refs(v)) for k, v in kwargs.iteritems())))
+        self.returned[id(obj)] = index
+        self.keep.append(obj)
+
+    def _wrap(self, target, name, func):
+        if name in self.unrecordable:
+            def unrecorded(*args, **kwargs):
+                self.complete = False
+                return func(*args, **kwargs)
+            return unrecorded
+        def recorded(*args, **kwargs):
+            if self.depth:
+                return func(*args, **kwargs)
+            self.depth += 1
+            try:
+                result = func(*args, **kwargs)
+            finally:
+                self.depth -= 1
+            index = len(self.calls)
+            self.calls.append((target, name, self._refs(args), dict((k, self._refs(v)) for k, v in kwargs.iteritems())))
+            if result is not None and not isinstance(result, (basestring, int, long, float)):
+                self.returned[id(result)] = index
+                self.keep.append(result)
+            return result
+        return recorded
+
+    def _refs(self, value):
+        if id(value) in self.returned:
+            return _RecordedRef(self.returned[id(value)])
+        if isinstance(value, (list, tuple)):
+            return type(value)(self._refs(v) for v in value)
+        if isinstance(value, type) and getattr(spss.CellText, value.__name__, None) is value:
+            return _RecordedCellType(value.__name__)   # e.g., a cell type for SetCellsByColumn
+        return value
+
+    @staticmethod
+    def replay(calls):
+        """Make the recorded calls again"""
+
+        results = []
+        def resolve(value):
+            if isinstance(value, _RecordedRef):
+                return results[value.index]
+            if isinstance(value, _RecordedCellType):
+                return getattr(spss.CellText, value.name)
+            if isinstance(value, (list, tuple)):
+                return type(value)(resolve(v) for v in value)
+            return value
+        for target, name, args, kwargs in calls:
+            if target is None:
+                func = getattr(spss, name)
+            else:
+                func = getattr(results[target], name)
+            results.append(func(*resolve(args), **dict((k, resolve(v)) for k, v in kwargs.iteritems())))
+
+class _RecordedRef(object):
+    """Stands for the object returned by recorded call index"""
+
+    def __init__(self, index):
+        self.index = index
+
+class _RecordedCellType(object):
+    """Stands for the CellText class name, which cannot be pickled directly"""
+
+    def __init__(self, name):
+        self.name = name
+
+_timings = {}   # (command, phase): list of durations in seconds
+_timingslock = threading.Lock()
+
+def _lap(cmdname, phase, start):
+    """Record the time since start for the phase of the command and return the current time"""
+
+    now = _timer()
+    _timingslock.acquire()
+    try:
+        try:
+            _timings[(cmdname, phase)].append(now - start)
+        except KeyError:
+            _timings[(cmdname, phase)] = [now - start]
+    finally:
+        _timingslock.release()
+    return now
+
+def timingstats():
+    """Return the recorded timings as a dictionary keyed by (command, phase).
+
+    Each value is a dictionary with the count and the total, median (p50) and 99th percentile (p99) times in seconds."""
+
+    _timingslock.acquire()
+    try:
+        timings = [(key, list(durations)) for key, durations in _timings.iteritems()]
+    finally:
+        _timingslock.release()
+    stats = {}
+    for key, durations in timings:
+        durations.sort()
+        n = len(durations)
+        stats[key] = {"count": n, "total": sum(durations),
+            "p50": durations[max(0, (n * 50 + 99) // 100 - 1)], "p99": durations[max(0, (n * 99 + 99) // 100 - 1)]}
+    return stats
+
+def timingtable():
+    """Produce the recorded timings as a pivot table"""
+
+    table = NonProcPivotTable("Timing", tabletitle=_("Extension Command Timing"),
+        columnlabels=[_("Count"), _("Total (ms)"), _("Median (ms)"), _("99th Percentile (ms)")])
+    for (cmdname, phase), st in sorted(timingstats().iteritems()):
+        table.addrow(cmdname + ": " + phase, [st["count"], st["total"] * 1000, st["p50"] * 1000, st["p99"] * 1000])
+    table.generate()
+
+def writetimings(filespec):
+    """Write the recorded timings to filespec as a JSON list with one object per command and phase"""
+
+    import json
+    stats = [dict(st, command=cmdname, phase=phase) for (cmdname, phase), st in sorted(timingstats().iteritems())]
+    fp = open(filespec, "w")
+    try:
+        json.dump(stats, fp, indent=1)
+    finally:
+        fp.close()
+
+def cleartimings():
+    """Discard the recorded timings"""
+
+    _timingslock.acquire()
+    try:
+        _timings.clear()
+    finally:
+        _timingslock.release()
+
+class MemoryProfiler(object):
+    """Measure the memory used by each phase of sampled processcmd calls.
+
+    The phases are parse (which includes variable list expansion), check (the required parameter check and
+    lastchancef), implementation (which includes any pivot tables it accumulates and produces), error report and
+    total.  For each command and phase, statistics gives the count, the peak and net memory in bytes and the
+    allocation sites that grew most.
+
+    With tracemalloc, which Python 2 provides only through the pytracemalloc backport, the peak is the highest
+    traced memory above the level at the start of the phase (or, without tracemalloc.reset_peak, at any time since
+    the command started), the net figure is the traced memory still allocated at its end, and the sites are source
+    lines.  Tracing is started for the command and stopped again after it, unless it was already on.  Without tracemalloc the net figure is the change in the resident set size, where the system
+    reports it, the peak is the growth of the process high-water mark (None if the phase stayed below an earlier
+    mark), and the sites are the types of the garbage-collected objects that were added, counted but not sized.
+
+    A fraction sample of the commands is profiled, chosen at random, and only one command at a time, so the
+    overhead can be bounded for long runs.  Allocations by other threads are still included.  topsites is the
+    number of sites kept for each phase of a command; 0 turns off the site listing, which is the expensive part."""
+
+    def __init__(self, sample=1.0, topsites=10):
+        self.sample = sample
+        self.topsites = topsites
+        self.lock = threading.Lock()
+        self.active = False
+        # (command, phase): {"peaks": [bytes or None], "nets": [bytes or None], "sites": {site: [size, count]}}
+        self.phases = {}
+        self.stats = {"commands": 0, "profiled": 0, "skipped": 0}
+        try:
+            import tracemalloc
+            self.tracemalloc = tracemalloc
+        except ImportError:
+            self.tracemalloc = None
+        import random
+        self.random = random.Random()
+
+    def begin(self, cmdname):
+        """Return a _CommandMemory for profiling the command or None if it is not sampled"""
+
+        self.lock.acquire()
+        try:
+            self.stats["commands"] += 1
+            if self.sample < 1.0 and self.random.random() >= self.sample:
+                return None
+            if self.active:   # measurements of concurrent commands would include each other's allocations
+                self.stats["skipped"] += 1
+                return None
+            self.active = True
+            self.stats["profiled"] += 1
+        finally:
+            self.lock.release()
+        try:
+            return _CommandMemory(self, cmdname)
+        except:
+            self.active = False
+            raise
+
+    def add(self, cmdname, phase, peak, net, sites):
+        self.lock.acquire()
+        try:
+            agg = self.phases.get((cmdname, phase))
+            if agg is None:
+                agg = self.phases[(cmdname, phase)] = {"peaks": [], "nets": [], "sites": {}}
+            agg["peaks"].append(peak)
+            agg["nets"].append(net)
+            for site, size, count in sites:
+                total = agg["sites"].setdefault(site, [0, 0])
+                total[0] += size or 0
+                total[1] += count
+        finally:
+            self.lock.release()
+
+    def statistics(self):
+        """Return the statistics as a dictionary keyed by (command, phase).
+
+        Each value is a dictionary with the count, the maximum and mean peak and the mean net memory in bytes,
+        which are None if they could not be measured, and sites, a list of (site, total size in bytes or None,
+        total count) for the sites that grew most."""
+
+        stats = {}
+        self.lock.acquire()
+        try:
+            for key, agg in self.phases.iteritems():
+                peaks = [p for p in agg["peaks"] if p is not None]
+                nets = [n for n in agg["nets"] if n is not None]
+                st = stats[key] = {"count": len(agg["peaks"]), "peakmax": None, "peakmean": None, "netmean": None}
+                if peaks:
+                    st["peakmax"] = max(peaks)
+                    st["peakmean"] = sum(peaks) / float(len(peaks))
+                if nets:
+                    st["netmean"] = sum(nets) / float(len(nets))
+                top = sorted(agg["sites"].iteritems(), key=lambda item: (-item[1][0], -item[1][1], item[0]))
+                st["sites"] = [(site, size or None, n) for site, (size, n) in top[:self.topsites]]
+        finally:
+            self.lock.release()
+        return stats
+
+    def table(self):
+        """Produce the statistics as a pivot table"""
+
+        table = NonProcPivotTable("Memory", tabletitle=_("Extension Command Memory"),
+            columnlabels=[_("Count"), _("Maximum Peak (KB)"), _("Mean Peak (KB)"), _("Mean Net (KB)"),
+                _("Top Allocation Sites")])
+        for (cmdname, phase), st in sorted(self.statistics().iteritems()):
+            row = [st["count"]]
+            for name in ("peakmax", "peakmean", "netmean"):
+                if st[name] is None:
+                    row.append(".")
+                else:
+                    row.append(st[name] / 1024.)
+            row.append("; ".join(size and "%s %+.1f KB" % (site, size / 1024.) or "%s %+d" % (site, n)
+                for site, size, n in st["sites"][:3]))
+            table.addrow(cmdname + ": " + phase, row)
+        table.generate()
+
+    def write(self, filespec):
+        """Write the statistics to filespec as a JSON list with one object per command and phase"""
+
+        import json
+        stats = [dict(st, command=cmdname, phase=phase)
+            for (cmdname, phase), st in sorted(self.statistics().iteritems())]
+        fp = open(filespec, "w")
+        try:
+            json.dump({"stats": self.stats, "tracemalloc": self.tracemalloc is not None, "phases": stats}, fp, indent=1)
+        finally:
+            fp.close()
+
+    def clear(self):
+        """Discard the statistics"""
+
+        self.lock.acquire()
+        try:
+            self.phases.clear()
+            for name in self.stats:
+                self.stats[name] = 0
+        finally:
+            self.lock.release()
+
+class _CommandMemory(object):
+    """Measurements of one command for a MemoryProfiler.  Call lap at the end of each phase and then end"""
+
+    def __init__(self, profiler, cmdname):
+        self.profiler = profiler
+        self.cmdname = cmdname
+        self.tracemalloc = profiler.tracemalloc
+        self.started = False
+        if self.tracemalloc is not None and not self.tracemalloc.is_tracing():
+            self.tracemalloc.start()
+            self.started = True
+        self.first = self.mark = self._measure()
+
+    def lap(self, phase):
+        """Record the phase that ends now and start the next one"""
+
+        now = self._measure()
+        self.profiler.add(self.cmdname, phase, *self._compare(self.mark, now))
+        self.mark = self._measure()   # excluding the memory used to compare
+
+    def skip(self):
+        """Start the next phase without recording the one that ends now"""
+
+        self.mark = self._measure()
+
+    def end(self):
+        """Record the whole command and stop measuring"""
+
+        try:
+            self.profiler.add(self.cmdname, "total", *self._compare(self.first, self._measure(), self.peak))
+        finally:
+            self.first = self.mark = None
+            if self.started:
+                self.tracemalloc.stop()
+            self.profiler.active = False
+
+    peak = 0   # highest peak of the phases so far, as the total peak when the peak is reset for each phase
+
+    def _measure(self):
+        """Return (current bytes, peak bytes, sites) for the present moment"""
+
+        tracemalloc = self.tracemalloc
+        if tracemalloc is not None:
+            current, peak = tracemalloc.get_traced_memory()
+            sites = None
+            if self.profiler.topsites:
+                sites = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+            if hasattr(tracemalloc, "reset_peak"):
+                self.peak = max(self.peak, peak)
+                tracemalloc.reset_peak()
+            return current, peak, sites
+        import resource, gc
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak *= sys.platform == "darwin" and 1 or 1024   # bytes on macOS, kilobytes elsewhere
+        sites = None
+        if self.profiler.topsites:
+            sites = {}
+            for obj in gc.get_objects():
+                name = type(obj).__name__
+                sites[name] = sites.get(name, 0) + 1
+        return _residentsize(), peak, sites
+
+    def _compare(self, before, after, peak=0):
+        """Return (peak, net, sites) between the measurements before and after"""
+
+        topsites = self.profiler.topsites
+        if self.tracemalloc is not None:
+            peak = max(peak, after[1]) - before[0]
+            sites = []
+            if topsites:
+                diffs = after[2].compare_to(before[2], "lineno")
+                sites = [(str(diff.traceback[0]), diff.size_diff, diff.count_diff) for diff in diffs[:topsites]
+                    if diff.size_diff > 0]
+            return peak, after[0] - before[0], sites
+        peak = None
+        if after[1] > before[1]:   # the process high-water mark rose during the phase
+            if before[0] is None:
+                peak = after[1] - before[1]
+            else:   # the two sizes are not measured alike, and other threads allocate too
+                peak = max(0, after[1] - before[0])
+        net = None
+        if before[0] is not None and after[0] is not None:
+            net = after[0] - before[0]
+        sites = []
+        if topsites:
+            growth = [(after[2][name] - before[2].get(name, 0), name) for name in after[2]]
+            sites = [("type " + name, None, n) for n, name in sorted(growth, reverse=True)[:topsites] if n > 0]
+        return peak, net, sites
+
+def _residentsize():
+    """Return the resident set size of this process in bytes or None if it is not available"""
+
+    try:
+        fp = open("/proc/self/statm")
+        try:
+            return int(fp.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        finally:
+            fp.close()
+    except (IOError, OSError, ValueError, AttributeError):
+        return None
+
+def startmemoryprofile(sample=1.0, topsites=10):
+    """Start measuring the memory used by a fraction sample of the processcmd calls.  See MemoryProfiler"""
+
+    global memoryprofiler
+    memoryprofiler = MemoryProfiler(sample, topsites)
+    return memoryprofiler
+
+def stopmemoryprofile():
+    """Stop measuring memory and return the MemoryProfiler, if any, for its statistics"""
+
+    global memoryprofiler
+    profiler, memoryprofiler = memoryprofiler, None
+    return profiler
+
+class TraceRecorder(object):
+    """Append a JSON lines record of each processcmd call to a file for replay.
+
+    The first time a Syntax object or VariableIndex is seen, a record describing it is written:
+      {"syntax": id, "cmd": command name, "templates": [[kwd, subc, var, ktype, islist, vallist, lazy, asarray, abbrev], ...]}
+      {"dict": id, "names": [variable names]}
+    and each command is then written as
+      {"run": syntax id, "dict": dict id, null or "other", "args": args, "outcome": "ok" or exception name,
+       "failed": null, "parse" or "implementation", "ms": elapsed milliseconds,
+       "params": paramsdigest of the parse result or null, "t": time}
+    The syntax id identifies equivalent Syntax objects.  dict is null if there was no vardict and "other" for a
+    vardict that is not a VariableIndex, such as an spssaux.VariableDict, whose names are not recorded.  failed
+    is the phase that raised the exception: parse includes the required parameter check and lastchancef.
+    Commands whose args cannot be written as JSON are counted in skipped but not written."""
+
+    def __init__(self, filespec):
+        self.filespec = filespec
+        self.fp = None
+        self.lock = threading.Lock()
+        self.syntaxids = {}   # Syntax signature -> id
+        self.dictids = {}   # VariableIndex version -> id
+        self.stats = {"records": 0, "skipped": 0}
+
+    def record(self, oobj, args, vardict, digest, outcome, elapsed, failed=None):
+        import json
+        self.lock.acquire()
+        try:
+            lines = []
+            syntaxid = self.syntaxids.get(oobj.signature)
+            if syntaxid is None:
+                syntaxid = self.syntaxids[oobj.signature] = len(self.syntaxids)
+                templates = [[t.kwd, t.subc, t.var, t.ktype, t.islist, t.vallist, t.lazy, t.asarray, t.abbrev]
+                    for kwds in oobj.subcdict.itervalues() for t in kwds.itervalues()]
+                lines.append(json.dumps({"syntax": syntaxid, "cmd": oobj.cmdname, "templates": templates}))
+            dictid = None
+            if isinstance(vardict, VariableIndex):
+                dictid = self.dictids.get(vardict.version)
+                if dictid is None:
+                    dictid = self.dictids[vardict.version] = len(self.dictids)
+                    lines.append(json.dumps({"dict": dictid, "names": vardict.names}))
+            elif vardict is not None:
+                dictid = "other"
+            try:
+                lines.append(json.dumps({"run": syntaxid, "dict": dictid, "args": args, "outcome": outcome,
+                    "failed": failed, "ms": round(elapsed * 1000, 4), "params": digest, "t": round(time.time(), 3)}, separators=(",", ":")))
+                self.stats["records"] += 1
+            except (TypeError, ValueError, UnicodeError):
+                self.stats["skipped"] += 1
+            if self.fp is None:
+                self.fp = open(self.filespec, "a")
+            self.fp.write("".join(line + "\n" for line in lines))
+            self.fp.flush()
+        finally:
+            self.lock.release()
+
+    def close(self):
+        if self.fp is not None:
+            self.fp.close()
+            self.fp = None
+
+def starttrace(filespec):
+    """Start appending a record of each processcmd call to filespec.  See TraceRecorder"""
+
+    global tracer
+    stoptrace()
+    tracer = TraceRecorder(filespec)
+    return tracer
+
+def stoptrace():
+    """Stop recording processcmd calls and close the trace file"""
+
+    global tracer
+    if tracer is not None:
+        tracer.close()
+        tracer = None
+
+def paramsdigest(params):
+    """Return a short digest of the parameter dictionary params for comparing parse results.
+
+    Lists, tuples and arrays are treated alike, and a LazyVarlist by its unexpanded specification.
+    Return None if params contains strings that are not valid in the session encoding."""
+
+    import json, hashlib
+    try:
+        return hashlib.sha1(json.dumps(params, sort_keys=True, default=_digestvalue)).hexdigest()[:16]
+    except UnicodeError:
+        return None
+
+def _digestvalue(value):
+    if isinstance(value, LazyVarlist):
+        return ["lazy"] + list(value.tokens)
+    if isinstance(value, (tuple, array.array)):
+        return list(value)
+    return repr(value)
+
+if os.environ.get("SPSS_EXTENSIONS_TRACE"):
+    starttrace(os.environ["SPSS_EXTENSIONS_TRACE"])
+
+if os.environ.get("SPSS_EXTENSIONS_MEMORY", "false").lower() != "false":
+    try:
+        startmemoryprofile(min(1.0, float(os.environ["SPSS_EXTENSIONS_MEMORY"])))
+    except ValueError:   # "true"
+        startmemoryprofile()
+    if os.environ.get("SPSS_EXTENSIONS_MEMORYFILE"):
+        import atexit
+        atexit.register(lambda: memoryprofiler is not None and
+            memoryprofiler.write(os.environ["SPSS_EXTENSIONS_MEMORYFILE"]))
+
+def exceptionmessage():
+    """Return the message for the exception being handled in a form that a pivot table will accept"""
+
+    import locale
+    myenc = locale.getlocale()[1]  # get current encoding in case conversions needed        
+    msg = sys.exc_info()[1]
+    if _isseq(msg):
+        # try to make error message into something a pivot table will understand
+        # avoid forcing a str conversion if possible, but numbers and classes need
+        # to be converted
+        #msg = ",".join([(isinstance(item, (float, int)) or item is None) and str(item) or \
+            #(isinstance(item, Exception) and str(item)) or item for item in msg])
+        msg = ",".join([unicodeit(item, myenc) for item in msg])
+    if len(msg) == 0:   # no message with exception
+        msg = str(sys.exc_info()[0])  # if no message, use the type of the exception (ugly)
+    return msg
+
+# When warningcollector is set, processcmd adds exception messages to it instead of producing
+# a Warnings table for each failing command.  See collectwarnings.
+warningcollector = None
+
+class WarningCollector(object):
+    """Accumulate warnings from many processcmd calls and produce them as a single table"""
+
+    def __init__(self, maxrows=500, maxcommands=None):
+        """maxrows is the number of warnings that causes the table to be produced.
+        maxcommands, if not None, is the number of processcmd calls after which any pending warnings are produced."""
+
+        self.maxrows = maxrows
+        self.maxcommands = maxcommands
+        self.rows = []
+        self.commands = 0
+
+    def add(self, cmdname, exctype, msg):
+        """Record a warning.  exctype is the exception class"""
+
+        self.rows.append((cmdname, getattr(exctype, "__name__", str(exctype)), msg))
+
+    def commanddone(self):
+        """Count a processcmd call and produce the table if a threshold has been reached"""
+
+        self.commands += 1
+        if (self.maxrows is not None and len(self.rows) >= self.maxrows) or \
+           (self.maxcommands is not None and self.commands >= self.maxcommands):
+            self.flush()
+
+    def flush(self):
+        """Produce the pending warnings, if any, as one table"""
+
+        rows, self.rows = self.rows, []
+        self.commands = 0
+        if rows:
+            warnings = NonProcPivotTable("Warnings", tabletitle=_("Warnings "),
+                columnlabels=[_("Command"), _("Exception"), _("Message")])
+            for row in rows:
+                warnings.addrow(cvalues=row)
+            warnings.generate()
+
+def collectwarnings(maxrows=500, maxcommands=None):
+    """Start collecting warnings from processcmd into a single table and return the collector.
+
+    maxrows and maxcommands are the thresholds at which the table is produced.  See WarningCollector.
+    Call flushwarnings at the end of the job so that pending warnings are not lost."""
+
+    global warningcollector
+    if warningcollector is not None:
+        warningcollector.flush()
+    warningcollector = WarningCollector(maxrows, maxcommands)
+    return warningcollector
+
+def flushwarnings(stop=False):
+    """Produce any collected warnings now.  If stop is True, return to a Warnings table per command"""
+
+    global warningcollector
+    if warningcollector is not None:
+        warningcollector.flush()
+        if stop:
+            warningcollector = None
+
+# Commands registered here are run by a WarmPool worker with processcmd and the registered Syntax object,
+# so the Syntax is built once per worker instead of once per command.
+# The key is the command name in upper case with words separated by blanks.
+registeredcommands = {}
+
+def registercommand(cmdname, oobj, f, **options):
+    """Register the Syntax object oobj and implementation f for extension command cmdname.
+
+    options are further processcmd arguments such as excludedargs.  An extension module can call this when it is
+    imported so that a WarmPool worker can run its command without calling the module's Run function."""
+
+    registeredcommands[cmdname.replace("_", " ").upper()] = (oobj, f, options)
+
+class WarmPool(object):
+    """Keep worker processes ready to run extension commands.
+
+    Each worker is a fresh interpreter, started with executable, and so a separate session that shares nothing
+    with this one.  Before the first command arrives it has imported this module, probed the plug-in version,
+    loaded its translation and imported the listed extension modules.  It then runs commands one at a time.
+    The spss module must be importable in the workers, and so must this module and the extension modules with
+    the sys.path of this process.  A worker that dies is replaced, or dropped if the replacement cannot start.
+    Use serve to make the pool available to other processes, which connect with extensionclient.WarmClient.
+    That module does not import spss, so a batch script does not start a session of its own."""
+
+    # the Python interpreter for the workers.  Set it if sys.executable is not Python, as in some products.
+    executable = sys.executable
+
+    def __init__(self, workers=2, modules=(), initializer=None):
+        """workers is the number of worker processes.
+        modules is a sequence of extension command or module names to import in each worker at start.
+        Clients of serve can only run the commands of these modules and those registered by the initializer.
+        initializer, if not None, is called with no arguments in each worker before this module is imported.
+        It must be a function defined at the top level of an importable module, not in __main__."""
+
+        import Queue, atexit
+        self.modules = tuple(modules)
+        self.initializer = initializer
+        self.idle = Queue.Queue()
+        self.workers = []
+        self.lock = threading.Lock()
+        self.counts = {"commands": 0, "errors": 0, "restarts": 0}
+        self.warmup = []   # seconds each worker took to get ready
+        self.address = None
+        self.authkey = None
+        self.stopping = False
+        started = [self._startworker() for i in range(workers)]
+        for worker in started:
+            self._ready(worker)
+            self.idle.put(worker)
+        atexit.register(self.close)
+
+    def _startworker(self):
+        process, conn = _startinterpreter(self.executable, "warmworkermain")
+        worker = (process, conn)
+        self.workers.append(worker)
+        try:
+            conn.send(sys.path)
+            conn.send((self.modules, self.initializer))
+        except (IOError, OSError):
+            pass   # the worker has already stopped, which _ready reports
+        return worker
+
+    def _ready(self, worker):
+        """Wait for worker to finish starting"""
+
+        try:
+            reply = worker[1].recv()
+        except (EOFError, IOError, OSError):
+            reply = ("error", "EOFError", "")
+        if reply[0] != "ready":
+            self._retire(worker)
+            raise RuntimeError(_("A worker process could not be started: %s") % reply[2])
+        self.warmup.append(reply[1])
+
+    def _retire(self, worker):
+        process, conn = worker
+        if worker in self.workers:
+            self.workers.remove(worker)
+        conn.close()
+        if process.poll() is None:
+            process.terminate()
+        process.wait()
+
+    def run(self, extname, args):
+        """Run extension command extname in a worker and return (result, warnings).
+
+        args is the dictionary processcmd receives for the command, i.e., after args = args[args.keys()[0]].
+        result is what the implementing function returns, and warnings is a list of
+        (command, exception, message) rows that would otherwise appear in a Warnings table.
+        A failure outside of processcmd, such as an unknown command, raises RuntimeError."""
+
+        reply = self._dispatch(("run", extname, args))
+        if reply[0] == "error":
+            raise RuntimeError("%s: %s" % reply[1:])
+        return reply[1], reply[2]
+
+    def stats(self):
+        """Return a dictionary of the number of workers, commands, errors and restarts and the warmup times"""
+
+        self.lock.acquire()
+        try:
+            result = dict(self.counts)
+        finally:
+            self.lock.release()
+        result["workers"] = len(self.workers)
+        result["warmup"] = list(self.warmup)
+        return result
+
+    def _dispatch(self, request):
+        """Send a request to an idle worker and return the reply"""
+
+        if request[0] == "stats":
+            return ("ok", self.stats(), [])
+        if not self.workers:
+            return ("error", "RuntimeError", _("No worker processes are running"))
+        worker = self.idle.get()
+        try:
+            worker[1].send(request)
+            reply = worker[1].recv()
+        except (EOFError, IOError, OSError):
+            # the worker died, perhaps in the command, so it is replaced
+            dead, worker = worker, None
+            reply = ("error", "RuntimeError", _("The worker process stopped while running the command: %s") % request[1])
+            worker = self._replace(dead)
+        finally:
+            # only a live worker goes back
+            if worker is not None:
+                self.idle.put(worker)
+        self._count("commands")
+        if reply[0] == "error":
+            self._count("errors")
+        return reply
+
+    def _replace(self, worker):
+        """Retire worker and return a ready replacement, or None if it could not be started.
+
+        The pool then has one worker fewer."""
+
+        try:
+            new = self._startworker()
+        finally:
+            self._retire(worker)
+        self._count("restarts")
+        try:
+            self._ready(new)
+        except RuntimeError:
+            return None   # _ready has retired it
+        return new
+
+    def _count(self, name):
+        self.lock.acquire()
+        try:
+            self.counts[name] += 1
+        finally:
+            self.lock.release()
+
+    def serve(self, address, authkey=None, keyfile=None):
+        """Accept extensionclient.WarmClient connections at address until a client asks for shutdown.
+
+        address and authkey are as for multiprocessing.connection.Listener: a (host, port) pair with a loopback
+        host, a Unix socket path, a Windows pipe name or None for a new socket or pipe.  Other hosts are refused, because a client that connects
+        can run code in the workers.  If authkey is None, a random key is generated.  The key is in self.authkey
+        and, if keyfile is given, is written to that file, readable only by this user, for the clients.
+        Each client is served in its own thread, and commands from all clients share the workers."""
+
+        from multiprocessing import AuthenticationError
+        from multiprocessing.connection import Listener
+        if not _localaddress(address):
+            raise ValueError(_("A warm pool can only be served at a loopback or pipe address: %s") % (address,))
+        if authkey is None:
+            import binascii
+            authkey = binascii.hexlify(os.urandom(16))
+        if keyfile is not None:
+            fd = os.open(keyfile, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0600)
+            fp = os.fdopen(fd, "w")
+            try:
+                fp.write(authkey)
+            finally:
+                fp.close()
+        self.authkey = authkey
+        listener = Listener(address, authkey=authkey)
+        self.address = listener.address
+        try:
+            while not self.stopping:
+                try:
+                    conn = listener.accept()
+                except (IOError, OSError, EOFError, AuthenticationError):
+                    continue   # e.g., a client with the wrong authkey
+                client = threading.Thread(target=self._serveclient, args=(conn, authkey))
+                client.daemon = True
+                client.start()
+        finally:
+            listener.close()
+
+    def _serveclient(self, conn, authkey):
+        try:
+            while True:
+                request = conn.recv()
+                if request[0] == "shutdown":
+                    self.stopping = True
+                    conn.send(("ok", None, []))
+                    # wake the accept call in serve so that it sees stopping
+                    from multiprocessing.connection import Client
+                    Client(self.address, authkey=authkey).close()
+                    break
+                if request[0] == "run":   # clients cannot import other modules into the workers
+                    conn.send(self._dispatch(("run", request[1], request[2], False)))
+                elif request[0] == "stats":
+                    conn.send(self._dispatch(request))
+                else:
+                    conn.send(("error", "ValueError", _("Unknown request: %s") % (request[0],)))
+        except (EOFError, IOError):
+            pass   # the client went away
+        finally:
+            conn.close()
+
+    def close(self):
+        """Stop the workers"""
+
+        while self.workers:
+            worker = self.workers[-1]
+            try:
+                worker[1].send(("stop",))
+                deadline = time.time() + 5
+                while worker[0].poll() is None and time.time() < deadline:
+                    time.sleep(0.01)
+            except (IOError, OSError):
+                pass
+            self._retire(worker)
+
+def servewarmpool(address, workers=2, modules=(), authkey=None, initializer=None, keyfile=None):
+    """Start a WarmPool and serve it at address until a client asks for shutdown.  See WarmPool and WarmPool.serve"""
+
+    pool = WarmPool(workers, modules, initializer)
+    try:
+        pool.serve(address, authkey, keyfile)
+    finally:
+        pool.close()
+
+def _localaddress(address):
+    """Return True if address is a loopback (host, port) pair, a Unix socket path or a Windows pipe name.
+
+    None, which lets the Listener choose a socket path or pipe name, is also local."""
+
+    if isinstance(address, tuple):
+        host = address[0]
+        return host == "localhost" or host == "::1" or host.startswith("127.")
+    return address is None or isinstance(address, basestring)
+
+def _warmworker(conn, modules, start):
+    """Prepare a WarmPool worker process and then run the commands sent on conn until told to stop.
+
+    start is the time the worker process started.  See extensionclient.warmworkermain."""
+
+    global warningcollector
+    try:
+        plugin1600()
+        privatetranslation(__file__)
+        for name in modules:
+            _extensionmodule(name)
+    except:
+        conn.send(_errorreply())
+        conn.close()
+        return
+    preloaded = set(name.replace("_", " ").upper() for name in modules)
+    conn.send(("ready", time.time() - start))
+    # warnings are returned with each result instead of being produced as tables
+    warningcollector = WarningCollector(maxrows=None)
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            break
+        if request[0] == "stop":
+            break
+        allowed = None
+        if request[3:] == (False,):   # from a client of WarmPool.serve
+            allowed = preloaded
+        try:
+            reply = ("ok", _warmcommand(request[1], request[2], allowed), warningcollector.rows)
+        except:
+            reply = _errorreply()
+        warningcollector.rows = []
+        try:
+            conn.send(reply)
+        except:
+            conn.send(_errorreply())   # the result could not be pickled
+    conn.close()
+
+def _warmcommand(extname, args, allowed=None):
+    """Run extension command extname in this process and return its result.
+
+    If allowed is not None, only registered commands and those in allowed, which have already been imported,
+    can be run."""
+
+    cmdname = extname.replace("_", " ").upper()
+    if not cmdname in registeredcommands:
+        if allowed is not None and not cmdname in allowed:
+            raise ValueError(_("The command is not available in this pool: %s") % extname)
+        module = _extensionmodule(extname)
+        if not cmdname in registeredcommands:   # importing did not register it
+            return module.Run({cmdname: args})
+    oobj, f, options = registeredcommands[cmdname]
+    return processcmd(oobj, args, f, **options)
+
+def _extensionmodule(name):
+    """Import and return the module implementing extension command name, e.g., SPSSINC CENSOR TABLES"""
+
+    modname = name.replace(" ", "_")
+    __import__(modname)
+    return sys.modules[modname]
+
+def _errorreply():
+    return ("error", sys.exc_info()[0].__name__, exceptionmessage())
 
 def unicodeit(value, myenc):
     if isinstance(value, (int, float)):
@@ -439,33 +2889,176 @@ def floatex(value, format=None):
     try:
         return float(value)
     except:
-        if format == "#.#":
-            #  comma must be the decimal and  no other decorations may be present
-            value = value.replace(",", ".")
-            return float(value)
-        # maybe a comma decimal or COMMA format
-        lastdot = value.rfind(".")
-        lastcomma = value.rfind(",")
-        if lastcomma > lastdot:  # handles DOT format and F or E with comma decimal
-            value = value.replace(".", "")
-            value = value.replace(",", ".")
-        elif lastdot > lastcomma:  # truly a dot decimal format
-            value = value.replace(",", "")   # handles COMMA format	    
-        v = value.replace(",", ".")
-        try:
-            return float(v)
-        except:
-            # this is getting annoying.  Maybe a decorated format.  "/" is included below
-            # to ensure that conversion will fail for date formats
+        return _floatrepair(value, format)
+
+def _floatrepair(value, format):
+    """Return value as a float after removing format decorations.  This is the fallback for floatex"""
+
+    if format == "#.#":
+        #  comma must be the decimal and  no other decorations may be present
+        value = value.replace(",", ".")
+        return float(value)
+    # maybe a comma decimal or COMMA format
+    lastdot = value.rfind(".")
+    lastcomma = value.rfind(",")
+    if lastcomma > lastdot:  # handles DOT format and F or E with comma decimal
+        value = value.replace(".", "")
+        value = value.replace(",", ".")
+    elif lastdot > lastcomma:  # truly a dot decimal format
+        value = value.replace(",", "")   # handles COMMA format	    
+    v = value.replace(",", ".")
+    try:
+        return float(v)
+    except:
+        # this is getting annoying.  Maybe a decorated format.  "/" is included below
+        # to ensure that conversion will fail for date formats
 
-            v = "".join([c for c in value if c.isdigit() or c in ["-", ".", "+", "e","E", "/"]])
-            return float(v)   # give up if this fails
+        v = "".join([c for c in value if c.isdigit() or c in ["-", ".", "+", "e","E", "/"]])
+        return float(v)   # give up if this fails
+
+def floatex_many(values, format=None, returnmask=False):
+    """Return an array of floats converted from a batch of formatted values as floatex would convert each one.
+
+    values is a list or NumPy string array of (unicode) strings, such as a column of cells from an output table.
+    format has the same meaning as for floatex and applies to the whole batch.
+    The sysmis value "." becomes NaN.  Values that cannot be converted also become NaN, and
+    if returnmask is True, the result is (floats, mask), where mask is True for those values.
+    The floats are a NumPy float64 array if NumPy is available and otherwise an array.array of type "d"."""
+
+    if hasattr(values, "tolist"):    # NumPy or array.array
+        values = values.tolist()
+    failed = [False] * len(values)
+    try:
+        result = list(map(float, values))   # plain numbers need no further work
+    except (ValueError, TypeError):
+        result = _floatbatch(values, format, failed)
+    try:
+        import numpy
+        result = numpy.array(result, dtype=numpy.float64)
+        failed = numpy.array(failed, dtype=bool)
+    except ImportError:
+        result = array.array("d", result)
+    if returnmask:
+        return result, failed
+    return result
+
+def _floatbatch(values, format, failed):
+    """Return the floats for values as floatex would convert each one, setting failed[i] for those that fail.
+
+    The strings of each type are converted together by _floatgroup.  Only the values it cannot settle go
+    through floatex one at a time."""
+
+    nan = float("nan")
+    result = [None] * len(values)
+    kinds = set(map(type, values))
+    for kind in (str, unicode):
+        if not kind in kinds:
+            continue
+        if len(kinds) == 1:
+            indexes = xrange(len(values))
+            floats = _floatgroup(values, format)
+        else:
+            indexes = [i for i, value in enumerate(values) if type(value) is kind]
+            floats = _floatgroup([values[i] for i in indexes], format)
+        for i, f in itertools.izip(indexes, floats):
+            result[i] = f
+    for i, value in enumerate(values):
+        if result[i] is not None:
+            continue
+        try:
+            result[i] = float(value)
+            continue
+        except (ValueError, TypeError):
+            pass
+        try:
+            if value.strip() == ".":
+                result[i] = nan
+                continue
+            result[i] = _floatrepair(value, format)
+        except Exception:
+            result[i] = nan
+            failed[i] = True
+    return result
+
+def _floatgroup(values, format):
+    """Return floats for values, which are all str or all unicode, as floatex would convert them.
+
+    The result is None for a value whose conversion needs a closer look, such as a sysmis value or one that
+    cannot be converted.  The decimal symbol and the decorations are worked out once for the batch, and the
+    values are translated in a single call for each decimal symbol.  Removing all the decorations at once
+    gives the same value as the separate attempts of _floatrepair, except for the words inf and nan, which
+    float accepts, so a batch containing their letters is left to floatex."""
+
+    chars = set().union(*values)
+    kind = type(values[0])
+    separator = None
+    for c in "\n\x00\x01\x02\x03":
+        if not c in chars:
+            separator = kind(c)
+            break
+    if separator is None:
+        return [None] * len(values)
+    if format == "#.#":   # only the comma is changed
+        groups = [(None, _floattable(kind, ",", ".", ""))]
+    else:
+        if [c for c in chars if c.lower() in "infinityan"]:
+            return [None] * len(values)
+        decorations = "".join(c for c in chars if not (c.isdigit() or c in "-.+eE/,"))
+        commadecimal = _floattable(kind, ",", ".", "." + decorations)
+        dotdecimal = _floattable(kind, "", "", "," + decorations)
+        if not "," in chars:
+            groups = [(None, dotdecimal)]
+        elif not "." in chars:
+            groups = [(None, commadecimal)]
+        else:   # the last of the two symbols in each value is its decimal
+            commalast = [v.rfind(",") > v.rfind(".") for v in values]
+            groups = [([i for i, c in enumerate(commalast) if c], commadecimal),
+                ([i for i, c in enumerate(commalast) if not c], dotdecimal)]
+    result = [None] * len(values)
+    for indexes, table in groups:
+        if indexes is None:
+            group = values
+        else:
+            group = [values[i] for i in indexes]
+        if not group:
+            continue
+        if kind is str:
+            parts = separator.join(group).translate(*table).split(separator)
+        else:
+            parts = separator.join(group).translate(table).split(separator)
+        try:
+            floats = map(float, parts)
+        except ValueError:
+            floats = map(_floatornone, parts)
+        if indexes is None:
+            result = floats
+        else:
+            for i, f in itertools.izip(indexes, floats):
+                result[i] = f
+    return result
+
+def _floattable(kind, old, new, delete):
+    """Return the translate arguments for str or unicode that replace the characters of old with those of new
+    and delete those of delete"""
+
+    if kind is str:
+        import string
+        return string.maketrans(old, new), delete
+    table = dict((ord(c), None) for c in delete)
+    table.update((ord(o), unicode(n)) for o, n in zip(old, new))
+    return table
+
+def _floatornone(value):
+    try:
+        return float(value)
+    except ValueError:
+        return None
 
 # The following routines are copied from spssaux in order to avoid the need to import that entire module
 def u(txt):
     """Return txt as Unicode or unmodified according to the SPSS mode"""
 
-    if not ok1600 or not isinstance(txt, str):
+    if not (ok1600 or ok1600 is None and plugin1600()) or not isinstance(txt, str):
         return txt
     if spss.PyInvokeSpss.IsUTF8mode():
         if isinstance(txt, unicode):
@@ -475,6 +3068,25 @@ def u(txt):
     else:
         return txt
 
+def sessionunicodemode():
+    """Return True if SPSS strings are UTF-8, i.e., the plug-in is version 16 or later and SPSS is in Unicode mode.
+
+    This is what u checks for each value, so a caller converting many values can check it once."""
+
+    return plugin1600() and spss.PyInvokeSpss.IsUTF8mode()
+
+def decodevalues(values, unicodemode=None):
+    """Return a new list of values, each converted as u would convert it.
+
+    unicodemode is the result of sessionunicodemode.  If it is None, the mode is only looked up if some value
+    is a byte string.  Values that are already Unicode or are not strings are left as they are."""
+
+    if unicodemode is None:
+        unicodemode = any(isinstance(v, str) for v in values) and sessionunicodemode()
+    if not unicodemode:
+        return list(values)
+    return [unicode(v, "utf-8") if isinstance(v, str) else v for v in values]
+
 def _isseq(obj):
     """Return True if obj is a sequence, i.e., is iterable.
 
@@ -527,7 +3139,9 @@ def transupport(thefile,localedir=None, lang=None, private=False):
     # languages.  This change should not be seen by the parent process, but the setting is
     # restored in case external mode is being used.
     
-    langcodes = {"schinese":"zh_CN", "tchinese":"zh_TW", "bportugu": "pt_BR"}
+    sys.displayhook = _dh  #suppress _ assignment
+    if private:
+        return privatetranslation(thefile, localedir, lang)
     origlang = os.environ.get("LANGUAGE")
     if lang is None:
         try:
@@ -535,23 +3149,171 @@ def transupport(thefile,localedir=None, lang=None, private=False):
         except:
             lang="english"
 
-    if lang in langcodes:
-        os.environ["LANGUAGE"] = langcodes[lang]
-    lang = langcodes.get(lang, lang)
+    if lang in _langcodes:
+        os.environ["LANGUAGE"] = _langcodes[lang]
     thename = os.path.basename(os.path.splitext(thefile)[0])
-    sys.displayhook = _dh  #suppress _ assignment
     if localedir is None:
         localedir=os.path.dirname(thefile) + "/" + thename  + "/lang"
-    if private:
-        tr = gettext.translation(thename, fallback=True, localedir=localedir,
-            languages=[lang])
-        if origlang:
-            os.environ["LANGUAGE"] = origlang
-        return tr.ugettext
+    getcatalog(thename, localedir).install(unicode=True)
+    if origlang:
+        os.environ["LANGUAGE"] = origlang
+
+_langcodes = {"schinese":"zh_CN", "tchinese":"zh_TW", "bportugu": "pt_BR"}
+
+def privatetranslation(thefile, localedir=None, lang=None):
+    """Return a function that retrieves translated strings for thefile.
+
+    The arguments are as for transupport.  Nothing is installed and no environment variable is changed,
+    so this is safe to use from any thread."""
+
+    if lang is None:
+        lang = os.environ.get("LANGUAGE", "english").lower()
+    lang = _langcodes.get(lang, lang)
+    thename = os.path.basename(os.path.splitext(thefile)[0])
+    if localedir is None:
+        localedir=os.path.dirname(thefile) + "/" + thename  + "/lang"
+    return getcatalog(thename, localedir, [lang]).ugettext
+
+# Translation catalogs are cached for the session keyed by (domain, localedir, languages).
+# An entry is trusted for catalogrecheckinterval seconds; after that the .mo files are located
+# again and reloaded only if the set of files or their modification times have changed.
+# The least recently used entry is dropped when there are more than catalogcachesize entries.
+catalogcachesize = 32
+catalogrecheckinterval = 10.0
+_catalogs = OrderedDict()
+_cataloglock = threading.Lock()
+catalogstats = {"hits": 0, "misses": 0, "reloads": 0, "evictions": 0}
+
+def getcatalog(domain, localedir=None, languages=None):
+    """Return a gettext translation object for domain, using the session catalog cache.
+
+    localedir and languages have the same meaning as for gettext.translation.  If languages is None,
+    it is taken from the gettext environment variables as gettext.install would do.
+    If no catalog is found, a NullTranslations object is returned."""
+
+    _cataloglock.acquire()
+    try:
+        return _getcatalog(domain, localedir, languages)
+    finally:
+        _cataloglock.release()
+
+def _getcatalog(domain, localedir, languages):
+    import gettext
+    if languages is None:
+        languages = _envlanguages()
+    key = (domain, localedir, tuple(languages))
+    now = time.time()
+    entry = _catalogs.pop(key, None)
+    if entry is None:
+        catalogstats["misses"] += 1
+        mofiles = gettext.find(domain, localedir, list(languages), all=1)
     else:
-        gettext.install(thename, localedir=localedir, unicode=True)
-        if origlang:
-            os.environ["LANGUAGE"] = origlang
+        stamp, tr, checked = entry
+        if now - checked < catalogrecheckinterval:
+            catalogstats["hits"] += 1
+            _catalogs[key] = entry   # reinsert as most recently used
+            return tr
+        mofiles = gettext.find(domain, localedir, list(languages), all=1)
+        if _catalogstamp(mofiles) == stamp:
+            catalogstats["hits"] += 1
+            _catalogs[key] = (stamp, tr, now)
+            return tr
+        catalogstats["reloads"] += 1
+    tr = _loadcatalog(mofiles)
+    _catalogs[key] = (_catalogstamp(mofiles), tr, now)
+    while len(_catalogs) > catalogcachesize:
+        _catalogs.popitem(last=False)
+        catalogstats["evictions"] += 1
+    return tr
+
+def catalogcachestats():
+    """Return a copy of the catalog cache counters with the current size and hit rate added"""
+
+    stats = dict(catalogstats)
+    lookups = stats["hits"] + stats["misses"] + stats["reloads"]
+    stats["size"] = len(_catalogs)
+    stats["hitrate"] = lookups and float(stats["hits"]) / lookups or 0.
+    return stats
+
+def clearcatalogcache():
+    """Empty the catalog cache and reset its counters"""
+
+    _cataloglock.acquire()
+    try:
+        _catalogs.clear()
+        for k in catalogstats:
+            catalogstats[k] = 0
+    finally:
+        _cataloglock.release()
+
+def _envlanguages():
+    """Return the language list that gettext would derive from the environment"""
+
+    languages = []
+    for envar in ('LANGUAGE', 'LC_ALL', 'LC_MESSAGES', 'LANG'):
+        val = os.environ.get(envar)
+        if val:
+            languages = val.split(':')
+            break
+    if not 'C' in languages:
+        languages.append('C')
+    return languages
+
+def _catalogstamp(mofiles):
+    """Return the file names and modification times identifying a set of .mo files"""
+
+    stamp = []
+    for mofile in mofiles:
+        try:
+            stamp.append((mofile, os.stat(mofile).st_mtime))
+        except OSError:
+            stamp.append((mofile, None))
+    return tuple(stamp)
+
+def _loadcatalog(mofiles):
+    """Return a translation object chaining the .mo files in order of preference"""
+
+    import gettext
+    result = None
+    for mofile in mofiles:
+        fp = open(mofile, 'rb')
+        try:
+            t = gettext.GNUTranslations(fp)
+        finally:
+            fp.close()
+        if result is None:
+            result = t
+        else:
+            result.add_fallback(t)
+    if result is None:
+        result = gettext.NullTranslations()
+    return result
+
+def deferredtranslation(thefile, private=True, lang=None):
+    """Return a stand-in for _ that calls transupport for thefile the first time a message is translated.
+
+    If private is False, the translation function is installed in builtins at that point as transupport would do.
+    lang is as for transupport, but it only applies if private is True."""
+
+    tr = []
+    def deferred(msg):
+        if not tr:
+            if private:
+                tr.append(privatetranslation(thefile, lang=lang))
+            else:
+                transupport(thefile, private=False)
+                tr.append(_builtins()._)
+        return tr[0](msg)
+    return deferred
+
+def _builtins():
+    """Return the builtins module"""
+
+    try:
+        import __builtin__ as builtins
+    except ImportError:
+        import builtins
+    return builtins
 
 def _dh(obj):
     """Function to override interactive expression display, disabling assignment to _"""
@@ -576,6 +3338,7 @@ class NonProcPivotTable(object):
         self.rowlabels = []
         self.columnvalues = []
         self.rowcount = 0
+        self.numericlabels = False   # True if any row label needs conversion for a one-column table
 
     def addrow(self, rowlabel=None, cvalues=None):
         """Append a row labelled rowlabel to the table and set value(s) from cvalues.
@@ -590,37 +3353,217 @@ class NonProcPivotTable(object):
             self.rowlabels.append(str(self.rowcount))
         else:
             self.rowlabels.append(rowlabel)
+            if isinstance(rowlabel, (int, float)):
+                self.numericlabels = True
         self.columnvalues.extend(cvalues)
         
     def generate(self):
         """Produce the table if it has any rows, assuming that a procedure state is now in effect or possible"""
         
-        privateproc = False
         if self.rowcount > 0:
-            try:
-                table = spss.BasePivotTable(self.tabletitle, self.omssubtype)
-            except:
-                spss.EndDataStep()  # just in case there is a dangling DataStep
-                spss.StartProcedure(self.procname)
-                privateproc = True
-                table = spss.BasePivotTable(self.tabletitle, self.omssubtype)
+            table, privateproc = _basepivottable(self.tabletitle, self.omssubtype, self.procname)
             if self.caption:
                 table.Caption(self.caption)
             if self.columnlabels != []:
                 table.SimplePivotTable(self.rowdim, self.rowlabels, self.coldim, 
                     self.columnlabels, self.columnvalues)
             else:
-                table.Append(spss.Dimension.Place.row,"rowdim",hideName=True,hideLabels=True)
-                table.Append(spss.Dimension.Place.column,"coldim",hideName=True,hideLabels=True)
+                # the whole column is set in one call rather than cell by cell
+                rowdim = table.Append(spss.Dimension.Place.row,"rowdim",hideName=True,hideLabels=True)
+                coldim = table.Append(spss.Dimension.Place.column,"coldim",hideName=True,hideLabels=True)
                 colcat = spss.CellText.String("Message")
-                for r in self.rowlabels:
-                    if isinstance(r, (int, float)):
-                        r = str(r)
-                    cellr = spss.CellText.String(r)
-                    table[(cellr, colcat)] = cellr
+                rowlabels = self.rowlabels
+                if self.numericlabels:
+                    rowlabels = [isinstance(r, (int, float)) and str(r) or r for r in rowlabels]
+                if len(set(rowlabels)) < len(rowlabels):   # a repeated message is a single row
+                    seen = set()
+                    rowlabels = [r for r in rowlabels if not (r in seen or seen.add(r))]
+                table.SetCategories(rowdim, [spss.CellText.String(r) for r in rowlabels])
+                table.SetCategories(coldim, colcat)
+                table.SetCellsByColumn(colcat, rowlabels, spss.CellText.String)
+            if privateproc:
+                spss.EndProcedure()
+
+def _basepivottable(tabletitle, omssubtype, procname):
+    """Return (a new BasePivotTable, True if a procedure named procname had to be started for it)"""
+
+    try:
+        return spss.BasePivotTable(tabletitle, omssubtype), False
+    except:
+        spss.EndDataStep()  # just in case there is a dangling DataStep
+        spss.StartProcedure(procname)
+        return spss.BasePivotTable(tabletitle, omssubtype), True
+
+class ColumnarPivotTable(object):
+    """Accumulate a pivot table with column labels column by column until it can be produced.
+
+    This is a NonProcPivotTable with columnlabels for large tables.  A column that only receives numbers keeps
+    them in an array of doubles.  A column that receives anything else keeps each distinct value once
+    and a small code per row.  Rows can be added singly or in blocks.  Row labels should be unique."""
+
+    __slots__ = ("omssubtype", "outlinetitle", "tabletitle", "caption", "rowdim", "coldim", "columnlabels",
+        "procname", "rowlabels", "columns", "rowcount")
+
+    def __init__(self, omssubtype, outlinetitle="", tabletitle="", caption="", rowdim="", coldim="",
+            columnlabels=(), procname="Messages"):
+        """The arguments are as for NonProcPivotTable, but columnlabels must not be empty."""
+
+        if not columnlabels:
+            raise ValueError(_("A columnar pivot table requires column labels"))
+        self.omssubtype = omssubtype
+        self.outlinetitle = outlinetitle
+        self.tabletitle = tabletitle
+        self.caption = caption
+        self.rowdim = rowdim
+        self.coldim = coldim
+        self.columnlabels = list(columnlabels)
+        self.procname = procname
+        self.rowlabels = []
+        self.columns = [_TableColumn() for c in self.columnlabels]
+        self.rowcount = 0
+
+    def addrow(self, rowlabel=None, cvalues=()):
+        """Append a row labelled rowlabel with one value from cvalues for each column.
+
+        If rowlabel is None, the row number is used."""
+
+        if len(cvalues) != len(self.columns):
+            raise ValueError(_("The number of values does not match the number of columns: %s") % len(cvalues))
+        self.rowcount += 1
+        self.rowlabels.append(rowlabel is None and str(self.rowcount) or rowlabel)
+        for column, value in zip(self.columns, cvalues):
+            column.append(value)
+
+    def addrows(self, rowlabels, rows):
+        """Append a block of rows.
+
+        rowlabels is a sequence with a label for each row or None to use the row numbers.
+        rows is a sequence of rows, each with one value for each column, such as a list of tuples or a
+        two-dimensional NumPy array.  Each column is extended once for the whole block."""
+
+        count = len(rows)
+        columns = [list(c) for c in zip(*rows)]
+        if count and len(columns) != len(self.columns):
+            raise ValueError(_("The number of values does not match the number of columns: %s") % len(columns))
+        if rowlabels is None:
+            rowlabels = [str(i) for i in xrange(self.rowcount + 1, self.rowcount + count + 1)]
+        elif len(rowlabels) != count:
+            raise ValueError(_("The number of row labels does not match the number of rows: %s") % len(rowlabels))
+        self.rowlabels.extend(rowlabels)
+        self.rowcount += count
+        for column, values in zip(self.columns, columns):
+            column.extend(values)
+
+    def footprint(self):
+        """Return the approximate number of bytes used by the row labels and cell values"""
+
+        return sys.getsizeof(self.rowlabels) + sum(sys.getsizeof(r) for r in self.rowlabels) + \
+            sum(column.footprint() for column in self.columns)
+
+    def generate(self):
+        """Produce the table if it has any rows, assuming that a procedure state is now in effect or possible.
+
+        The cells are set a column at a time, so only one column is ever held as Python objects."""
+
+        if self.rowcount > 0:
+            table, privateproc = _basepivottable(self.tabletitle, self.omssubtype, self.procname)
+            if self.caption:
+                table.Caption(self.caption)
+            rowdim = table.Append(spss.Dimension.Place.row, self.rowdim or "rowdim", hideName=not self.rowdim)
+            coldim = table.Append(spss.Dimension.Place.column, self.coldim or "coldim", hideName=not self.coldim)
+            table.SetCategories(rowdim, [_celltext(r) for r in self.rowlabels])
+            colcats = [_celltext(c) for c in self.columnlabels]
+            table.SetCategories(coldim, colcats)
+            for colcat, column in zip(colcats, self.columns):
+                table.SetCellsByColumn(colcat, column.cells(), column.codes is None and spss.CellText.Number or _celltext)
             if privateproc:
                 spss.EndProcedure()
-                
+
+class _TableColumn(object):
+    """The values of one ColumnarPivotTable column.
+
+    Numbers are kept in values, an array of doubles, until a value that is not a number arrives.  Then all the
+    values are kept as labels, the list of distinct values, and codes, the index in labels of the value in each row.
+    A number is a value that _celltext makes a Number of, so a bool, which the array would take as 0 or 1, is not."""
+
+    __slots__ = ("values", "codes", "labels", "index")
+
+    def __init__(self):
+        self.values = array.array("d")
+        self.codes = None
+        self.labels = None
+        self.index = None
+
+    def append(self, value):
+        if self.codes is None:
+            if _numbertype(type(value)):
+                try:
+                    self.values.append(value)
+                    return
+                except OverflowError:
+                    pass
+            self._tolabels()
+        self._code(value)
+
+    def extend(self, values):
+        if self.codes is None:
+            if not isinstance(values, (list, tuple)):
+                values = list(values)
+            if all(_numbertype(t) for t in set(map(type, values))):
+                n = len(self.values)
+                try:
+                    self.values.extend(values)
+                    return
+                except OverflowError:
+                    del self.values[n:]   # a failed extend leaves the values before the one that failed
+            self._tolabels()
+        for value in values:
+            self._code(value)
+
+    def _tolabels(self):
+        values, self.values = self.values, None
+        self.codes = array.array("i")
+        self.labels = []
+        self.index = {}
+        for value in values:
+            self._code(value)
+
+    def _code(self, value):
+        key = value
+        if value.__class__ is bool:   # equal to 1 or 0 but not produced as a number
+            key = (bool, value)
+        code = self.index.get(key)
+        if code is None:
+            code = self.index[key] = len(self.labels)
+            self.labels.append(value)
+        self.codes.append(code)
+
+    def cells(self):
+        if self.codes is None:
+            return self.values.tolist()
+        labels = self.labels
+        return [labels[c] for c in self.codes]
+
+    def footprint(self):
+        if self.codes is None:
+            return sys.getsizeof(self.values)
+        return sys.getsizeof(self.codes) + sys.getsizeof(self.labels) + sys.getsizeof(self.index) + \
+            sum(sys.getsizeof(label) for label in self.labels)
+
+def _numbertype(cls):
+    """Return True if _celltext makes a Number of a value of type cls"""
+
+    return issubclass(cls, (int, long, float)) and not issubclass(cls, bool)
+
+def _celltext(value):
+    """Return value as a CellText object: a Number for a number and otherwise a String"""
+
+    if isinstance(value, (int, long, float)) and not isinstance(value, bool):
+        return spss.CellText.Number(value)
+    if value is None:
+        value = ""
+    return spss.CellText.String(value)
+
 def attributesFromDict(d):
     """build self attributes from a dictionary d."""
     self = d.pop('self')
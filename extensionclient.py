@@ -0,0 +1,155 @@
+"""Client for running EXTENSION commands in a warm extension.WarmPool
+
+This module does not import spss, so a batch script can submit commands to a pool of
+sessions that are already running without starting a session of its own.  It also holds
+the entry points of the worker processes of the pool and of extension.getprocesspool, which
+are fresh interpreters that must not import spss before the pool's initializer has run.
+
+Example
+    client = WarmClient(("localhost", 6000), keyfile="pool.key")
+    result, warnings = client.submit("SPSSINC CENSOR TABLES", {"": [{"VALUE": "3"}]})
+"""
+
+# History
+# 17-oct-2026 Initial version
+# 17-oct-2026 read the authentication key from a file, add the worker entry point
+# 17-oct-2026 add the entry point of the process pool workers
+
+class WarmClient(object):
+    """Submit extension commands to a WarmPool served at address"""
+
+    def __init__(self, address, authkey=None, keyfile=None):
+        """authkey is the key the pool was served with.  If it is None, it is read from keyfile,
+        the file that WarmPool.serve wrote it to."""
+
+        from multiprocessing.connection import Client
+        if authkey is None and keyfile is not None:
+            fp = open(keyfile)
+            try:
+                authkey = fp.read().strip()
+            finally:
+                fp.close()
+        self.conn = Client(address, authkey=authkey)
+
+    def submit(self, extname, args):
+        """Run extension command extname with args in a warm worker and return (result, warnings).  See extension.WarmPool.run"""
+
+        return self._request(("run", extname, args))
+
+    def stats(self):
+        """Return the statistics of the pool.  See extension.WarmPool.stats"""
+
+        return self._request(("stats",))[0]
+
+    def shutdown(self):
+        """Ask the server to stop accepting clients.  Commands already submitted still complete"""
+
+        self._request(("shutdown",))
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def _request(self, request):
+        self.conn.send(request)
+        reply = self.conn.recv()
+        if reply[0] == "error":
+            raise RuntimeError("%s: %s" % reply[1:])
+        return reply[1], reply[2]
+
+class PipeConnection(object):
+    """Send and receive pickled objects over a pair of file objects, such as the pipes of a subprocess"""
+
+    def __init__(self, infile, outfile):
+        self.infile = infile
+        self.outfile = outfile
+
+    def send(self, obj):
+        import cPickle
+        data = cPickle.dumps(obj, 2)   # nothing is written if obj cannot be pickled
+        self.outfile.write(data)
+        self.outfile.flush()
+
+    def recv(self):
+        """Return the next object.  Raise EOFError if the other end has closed"""
+
+        import cPickle
+        return cPickle.load(self.infile)
+
+    def close(self):
+        for f in (self.outfile, self.infile):
+            try:
+                f.close()
+            except (IOError, OSError):
+                pass
+
+def warmworkermain():
+    """Run a WarmPool worker process.  WarmPool starts each worker as a fresh interpreter that calls this.
+
+    The pool sends its sys.path and then the worker modules and initializer on standard input.  The initializer
+    runs before extension, and so spss, is imported.  Replies go to the original standard output, and anything
+    else written there goes to standard error instead."""
+
+    import sys, time
+    start = time.time()
+    conn = _workerconnection()
+    try:
+        path = conn.recv()
+        sys.path[:0] = [p for p in path if not p in sys.path]
+        modules, initializer = conn.recv()
+        if initializer is not None:
+            initializer()
+        import extension
+    except:
+        conn.send(("error", sys.exc_info()[0].__name__, str(sys.exc_info()[1])))
+        conn.close()
+        return
+    extension._warmworker(conn, modules, start)
+
+def poolworkermain():
+    """Run a worker of extension.getprocesspool.  The pool starts each worker as a fresh interpreter that calls this.
+
+    The pool sends its sys.path and then one pickled (function, args, kwargs) call at a time, and the worker
+    replies with the pickled value or exception.  The worker stops at the end of its standard input."""
+
+    import sys, cPickle
+    conn = _workerconnection()
+    try:
+        path = conn.recv()
+    except EOFError:
+        return
+    sys.path[:0] = [p for p in path if not p in sys.path]
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            break
+        try:
+            f, args, kwargs = cPickle.loads(request[1])
+            reply = ("ok", cPickle.dumps(f(*args, **kwargs), 2))
+        except:
+            error = sys.exc_info()[1]
+            try:
+                message = str(error)
+            except UnicodeError:
+                message = repr(error)
+            try:
+                data = cPickle.dumps(error, 2)
+            except Exception:
+                data = None
+            reply = ("error", type(error).__name__, message, data)
+        conn.send(reply)
+
+def _workerconnection():
+    """Return a PipeConnection on standard input and the original standard output of a worker process.
+
+    Anything else written to standard output goes to standard error instead."""
+
+    import os, sys
+    if sys.platform == "win32":
+        import msvcrt
+        msvcrt.setmode(sys.stdin.fileno(), os.O_BINARY)
+        msvcrt.setmode(sys.stdout.fileno(), os.O_BINARY)
+    channel = os.fdopen(os.dup(sys.stdout.fileno()), "wb")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    return PipeConnection(sys.stdin, channel)
@@ -0,0 +1,38 @@
+"""Check that an int or float list Template with asarray always gives an array
+
+usage: python -m unittest discover tests"""
+
+import os, sys, array, unittest
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(os.path.dirname(here), "benchmarks"), os.path.dirname(here)]
+import spssstub
+spssstub.install()
+import extension
+from extension import Template, Syntax
+
+limit = 2 ** (8 * array.array(extension._inttypecode).itemsize - 1)
+
+def parse(template, values):
+    return Syntax([template]).parsecmd({"": [{template.kwd: values}]}).parsedparams[template.var]
+
+class AsArrayTest(unittest.TestCase):
+    def test_int(self):
+        template = Template("N", ktype="int", islist=True, vallist=[-limit, limit - 1], asarray=True)
+        for values in [["1", "2"], [str(limit - 1), str(-limit)], []]:
+            value = parse(template, values)
+            self.assertTrue(isinstance(value, array.array))
+            self.assertEqual(value.tolist(), [int(v) for v in values])
+
+    def test_int_range(self):
+        # a range the array type cannot hold is refused when the Template is made, not at parse time
+        self.assertRaises(ValueError, Template, "N", ktype="int", islist=True, vallist=[0, limit], asarray=True)
+        self.assertRaises(ValueError, Template, "N", ktype="int", islist=True, vallist=[-limit - 1, 0], asarray=True)
+        self.assertEqual(parse(Template("N", ktype="int", islist=True, vallist=[0, limit]), [str(limit)]), [limit])
+
+    def test_float(self):
+        value = parse(Template("X", ktype="float", islist=True, asarray=True), ["1.5", "1e300"])
+        self.assertEqual((value.typecode, value.tolist()), ("d", [1.5, 1e300]))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+"""Check that ColumnarPivotTable produces the cells that _celltext would produce for the same values
+
+usage: python -m unittest discover tests"""
+
+import os, sys, unittest
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(os.path.dirname(here), "benchmarks"), os.path.dirname(here)]
+import spssstub
+spssstub.install()
+import extension
+
+class FloatSubclass(float):
+    pass
+
+def typed(value):
+    """Return value with its type, since True == 1.0 but a String cell is not a Number cell"""
+
+    return type(value), value
+
+class ColumnarTest(unittest.TestCase):
+    columns = [
+        [1, 2.5, 3L],
+        [True, False, True],
+        [1.5, True, 0],
+        [FloatSubclass(2.5), 1, 2],
+        [1, "a", None],
+        [0, 1, False]]
+
+    def setUp(self):
+        spssstub.procedurestate.append("test")
+        del spssstub.tables[:]
+
+    def tearDown(self):
+        spssstub.procedurestate.remove("test")
+        del spssstub.tables[:]
+
+    def expected(self):
+        return dict(((str(i + 1), "c%d" % j), typed(extension._celltext(value).value))
+            for j, values in enumerate(self.columns) for i, value in enumerate(values))
+
+    def generate(self, add):
+        table = extension.ColumnarPivotTable("Test", columnlabels=["c%d" % j for j in range(len(self.columns))])
+        add(table, zip(*self.columns))
+        table.generate()
+        return dict((key, typed(value)) for key, value in spssstub.tables[-1].cells.iteritems())
+
+    def test_addrow(self):
+        def add(table, rows):
+            for row in rows:
+                table.addrow(cvalues=row)
+        self.assertEqual(self.generate(add), self.expected())
+
+    def test_addrows(self):
+        self.assertEqual(self.generate(lambda table, rows: table.addrows(None, rows)), self.expected())
+
+    def test_bool_column(self):
+        column = extension._TableColumn()
+        column.extend([1, 2])
+        column.append(True)
+        self.assertEqual(column.cells(), [1, 2, True])
+        self.assertTrue(column.cells()[2] is True)
+
+if __name__ == "__main__":
+    unittest.main()
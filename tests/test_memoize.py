@@ -0,0 +1,161 @@
+"""Check that memoized commands in different threads run concurrently and record only their own output
+
+usage: python -m unittest discover tests"""
+
+import os, sys, threading, unittest
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(os.path.dirname(here), "benchmarks"), os.path.dirname(here)]
+import spssstub
+spssstub.install()
+import extension
+from extension import Template, Syntax
+import spss
+
+realtable = spss.BasePivotTable
+
+oobj = Syntax([Template("N", ktype="int")])
+started = threading.Event()
+release = threading.Event()
+
+@extension.memoize
+def slowreport(n):
+    """Wait for release between its two text blocks"""
+
+    spss.TextBlock("slow", "first %d" % n)
+    started.set()
+    release.wait(10)
+    spss.TextBlock("slow", "second %d" % n)
+    return n
+
+@extension.memoize
+def quickreport(n):
+    spss.TextBlock("quick", "only %d" % n)
+    return n
+
+@extension.memoize
+def checkingreport(n):
+    """Produce a table and a text block, checking their types as implementations may, and wait for release"""
+
+    table = spss.BasePivotTable("table %d" % n, "Sub")
+    row = table.Append(spss.Dimension.Place.row, "R")
+    column = table.Append(spss.Dimension.Place.column, "C")
+    table.SetCategories(row, spss.CellText.String("r"))
+    table.SetCategories(column, spss.CellText.String("c"))
+    table[(spss.CellText.String("r"), spss.CellText.String("c"))] = spss.CellText.Number(n)
+    block = spss.TextBlock("block", "line 1")
+    block.append("line 2")
+    class Subclass(spss.BasePivotTable):
+        pass
+    started.set()
+    release.wait(10)
+    return [isinstance(table, spss.BasePivotTable), isinstance(block, spss.TextBlock),
+        issubclass(Subclass, spss.BasePivotTable), table.title == "table %d" % n]
+
+def output():
+    """Return and clear the tables and text blocks produced"""
+
+    result = []
+    for t in spssstub.tables:
+        if hasattr(t, "cells"):
+            result.append((t.title, sorted(t.cells.items()), [(d.name, d.categories) for d in t.dimensions]))
+        else:
+            result.append((t.name, t.content))
+    del spssstub.tables[:]
+    return result
+
+def run(f, n, vardict=None):
+    return extension.processcmd(oobj, {"": [{"N": str(n)}]}, f, vardict=vardict)
+
+class MemoizeThreadTest(unittest.TestCase):
+    def setUp(self):
+        spssstub.procedurestate.append("test")   # text blocks need a procedure state
+        self.saved = spssstub.variables, spssstub.casecount
+        spssstub.variables, spssstub.casecount = ["v%d" % i for i in range(100)], 10
+        extension.invalidatevariableindex()
+        extension.invalidateresults()
+        del spssstub.tables[:]
+        started.clear()
+        release.clear()
+        self.hits = extension.resultcachestats()["hits"]
+
+    def tearDown(self):
+        release.set()
+        spssstub.procedurestate.remove("test")
+        spssstub.variables, spssstub.casecount = self.saved
+        extension.invalidatevariableindex()
+        extension.invalidateresults()
+        del spssstub.tables[:]
+
+    def contents(self):
+        return sorted(t.content for t in spssstub.tables)
+
+    def test_concurrent(self):
+        slow = threading.Thread(target=run, args=(slowreport, 1))
+        slow.start()
+        self.assertTrue(started.wait(10))
+        # while slowreport is being recorded, other threads run memoized and ordinary commands
+        self.assertEqual(run(quickreport, 2), 2)
+        spss.TextBlock("other", "unrelated")
+        self.assertTrue(slow.is_alive())
+        release.set()
+        slow.join()
+        self.assertEqual(self.contents(), ["first 1", "only 2", "second 1", "unrelated"])
+        # the replay of each result contains only the output of its own command
+        del spssstub.tables[:]
+        run(slowreport, 1)
+        self.assertEqual(self.contents(), ["first 1", "second 1"])
+        del spssstub.tables[:]
+        run(quickreport, 2)
+        self.assertEqual(self.contents(), ["only 2"])
+        self.assertEqual(extension.resultcachestats()["hits"] - self.hits, 2)
+        self.assertTrue(spss.TextBlock is spssstub.TextBlock)
+
+    def test_isinstance(self):
+        existing = spss.BasePivotTable("existing", "Sub")
+        results = []
+        recording = threading.Thread(target=lambda: results.append(run(checkingreport, 4)))
+        recording.start()
+        self.assertTrue(started.wait(10))
+        try:
+            # while the other thread records, the spss classes still work as classes in this thread
+            self.assertFalse(spss.BasePivotTable is realtable)
+            self.assertTrue(isinstance(existing, spss.BasePivotTable))
+            class Other(spss.BasePivotTable):
+                pass
+            self.assertTrue(isinstance(Other("other", "Sub"), spss.BasePivotTable))
+            self.assertTrue(isinstance(spss.TextBlock("other", "text"), spss.TextBlock))
+        finally:
+            release.set()
+            recording.join()
+        self.assertEqual(results, [[True, True, True, True]])
+        recorded = [t for t in output() if t[0] not in ("existing", "other")]
+        self.assertEqual(len(recorded), 2)
+        self.assertEqual(run(checkingreport, 4), [True, True, True, True])
+        self.assertEqual(output(), recorded)
+        self.assertEqual(extension.resultcachestats()["hits"] - self.hits, 1)
+        self.assertTrue(spss.BasePivotTable is realtable)
+
+    def test_names_read_once(self):
+        reads = []
+        getname = spssstub.GetVariableName
+        def counted(index):
+            reads.append(index)
+            return getname(index)
+        spss.GetVariableName = counted
+        try:
+            run(quickreport, 3, extension.getvariableindex())
+            self.assertEqual(len(reads), 100)
+            del reads[:]
+            # an index checked for an earlier command is checked again
+            vardict = extension.getvariableindex()
+            del reads[:]
+            run(quickreport, 3, vardict)
+            run(quickreport, 3, vardict)
+            self.assertEqual(len(reads), 100)
+        finally:
+            spss.GetVariableName = getname
+        self.assertEqual(extension.resultcachestats()["hits"] - self.hits, 2)
+
+if __name__ == "__main__":
+    unittest.main()
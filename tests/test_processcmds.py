@@ -0,0 +1,131 @@
+"""Check that each command of processcmds is timed, traced, memoized and counted as processcmd does it
+
+usage: python -m unittest discover tests"""
+
+import os, sys, json, locale, shutil, tempfile, threading, time, unittest
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(os.path.dirname(here), "benchmarks"), os.path.dirname(here)]
+import spssstub
+spssstub.install()
+import extension
+from extension import Template, Syntax
+
+oobj = Syntax([Template("N", ktype="int", vallist=[0, 100])], parent="square.py")
+
+def square(n):
+    if n == 13:
+        raise ValueError("unlucky")
+    return n * n
+
+def worker():
+    return os.getpid(), sys.argv[0]
+
+def stop():
+    os._exit(1)
+
+def setlocale():
+    """Set a locale with an encoding, which exception messages are converted with"""
+
+    for name in ["", "C.UTF-8", "en_US.UTF-8"]:
+        try:
+            locale.setlocale(locale.LC_ALL, name)
+        except locale.Error:
+            continue
+        if locale.getlocale()[1] is not None:
+            return
+
+class ProcessCmdsTest(unittest.TestCase):
+    def setUp(self):
+        setlocale()
+        self.dir = tempfile.mkdtemp()
+        self.saved = spssstub.variables, spssstub.casecount
+        spssstub.variables, spssstub.casecount = ["a", "b"], 10
+        extension.timingenabled = True
+        extension.cleartimings()
+        extension.invalidateresults()
+        extension.collectwarnings(maxrows=None)
+        self.submitted = []
+        pool = extension.getprocesspool()
+        self.submit = pool.submit
+        def submit(f, *args, **kwargs):
+            self.submitted.append(kwargs)
+            return self.submit(f, *args, **kwargs)
+        pool.submit = submit
+
+    def tearDown(self):
+        del extension.getprocesspool().submit
+        extension.stoptrace()
+        extension.warningcollector = None
+        extension.timingenabled = False
+        extension.cleartimings()
+        extension.invalidateresults()
+        spssstub.variables, spssstub.casecount = self.saved
+        shutil.rmtree(self.dir)
+
+    def batch(self, values):
+        return extension.processcmds(oobj, [{"": [{"N": v}]} for v in values], square, memoize=True)
+
+    def test_bookkeeping(self):
+        tracefile = os.path.join(self.dir, "trace.jsonl")
+        extension.starttrace(tracefile)
+        self.assertEqual(self.batch(["2", "3", "999", "13"]), [4, 9, None, None])
+        extension.stoptrace()
+        stats = extension.timingstats()
+        self.assertEqual(stats[("square", "total")]["count"], 4)
+        self.assertEqual(stats[("square", "parse")]["count"], 3)   # 999 fails the range check in the parse
+        self.assertEqual(stats[("square", "implementation")]["count"], 2)
+        self.assertEqual(stats[("square", "error report")]["count"], 2)
+        runs = [json.loads(line) for line in open(tracefile) if '"run"' in line]
+        self.assertEqual([r["outcome"] for r in runs], ["ok", "ok", "ValueError", "ValueError"])
+        self.assertEqual(extension.warningcollector.commands, 4)
+        self.assertEqual(len(extension.warningcollector.rows), 2)
+
+    def test_memoize(self):
+        self.assertEqual(self.batch(["2", "3"]), [4, 9])
+        self.assertEqual(len(self.submitted), 2)
+        hits = extension.resultcachestats()["hits"]
+        self.assertEqual(self.batch(["3", "2", "4"]), [9, 4, 16])
+        self.assertEqual(self.submitted[2:], [{"n": 4}])
+        self.assertEqual(extension.resultcachestats()["hits"] - hits, 2)
+
+    def test_pool(self):
+        pool = extension.getprocesspool()
+        pid, argv = pool.submit(worker).result(30)
+        # a fresh interpreter started with -c, not a fork of this process
+        self.assertNotEqual(pid, os.getpid())
+        self.assertEqual(argv, "-c")
+        self.assertRaises(ValueError, pool.submit(square, 13).result, 30)
+        self.assertRaises(Exception, pool.submit(lambda: 1).result, 30)   # cannot be pickled
+        # a worker that dies is replaced
+        self.assertRaises(RuntimeError, pool.submit(stop).result, 30)
+        self.assertEqual([pool.submit(square, n).result(30) for n in range(4)], [0, 1, 4, 9])
+        self.assertEqual(len(pool.workers), len(set(pool.workers)))
+
+    def test_threads(self):
+        running, most = [0], [0]
+        lock = threading.Lock()
+        def wait(n):   # not picklable, which threads do not need
+            lock.acquire()
+            running[0] += 1
+            most[0] = max(most[0], running[0])
+            lock.release()
+            time.sleep(.1)
+            lock.acquire()
+            running[0] -= 1
+            lock.release()
+            if n == 13:
+                raise ValueError("unlucky")
+            return n
+        start = time.time()
+        values = ["1", "2", "3", "13", "5", "6", "999", "8"]
+        results = extension.processcmds(oobj, [{"": [{"N": v}]} for v in values], wait, threads=3)
+        self.assertEqual(results, [1, 2, 3, None, 5, 6, None, 8])
+        self.assertEqual(most[0], 3)
+        self.assertTrue(time.time() - start < .5)   # one after another would take .7 seconds
+        self.assertEqual(self.submitted, [])
+        self.assertEqual(extension.warningcollector.commands, 8)
+        self.assertEqual(len(extension.warningcollector.rows), 2)
+
+if __name__ == "__main__":
+    unittest.main()
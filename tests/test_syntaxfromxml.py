@@ -0,0 +1,79 @@
+"""Check that syntaxfromxml reads a standard extension XML file as the equivalent hand-written Templates would
+
+usage: python -m unittest discover tests"""
+
+import os, sys, shutil, tempfile, unittest
+
+here = os.path.dirname(os.path.abspath(__file__))
+root = os.path.dirname(here)
+sys.path[:0] = [os.path.join(root, "benchmarks"), root]
+import spssstub
+spssstub.install()
+import extension
+from extension import Template, Syntax
+
+def handwritten():
+    """The Templates an extension module would write by hand for sample.xml"""
+
+    return [
+        Template("VARIABLES", subc="", ktype="existingvarlist", islist=True),
+        Template("ID", subc="", ktype="varname"),
+        Template("METHOD", subc="OPTIONS", ktype="str", vallist=["fast", "exact"]),
+        Template("MISSING", subc="OPTIONS", ktype="bool", vallist=["yes", "no"]),
+        Template("ITERATIONS", subc="OPTIONS", ktype="int", vallist=[1, 100]),
+        Template("CUTS", subc="OPTIONS", ktype="float", islist=True),
+        Template("TITLE", subc="OPTIONS", ktype="literal"),
+        Template("", subc="EXTRA", var="extra", ktype="literal", islist=True)]
+
+class SyntaxFromXmlTest(unittest.TestCase):
+    def setUp(self):
+        # the cache file is written next to the XML file, so work on a copy
+        self.dir = tempfile.mkdtemp()
+        self.xmlfile = os.path.join(self.dir, "sample.xml")
+        shutil.copy(os.path.join(here, "sample.xml"), self.xmlfile)
+        extension._xmltemplates.clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_templates(self):
+        self.assertEqual(extension.syntaxfromxml(self.xmlfile).signature, Syntax(handwritten()).signature)
+
+    def test_cached_templates(self):
+        extension.syntaxfromxml(self.xmlfile)
+        self.assertTrue(os.path.exists(os.path.join(self.dir, "sample.syntaxcache")))
+        extension._xmltemplates.clear()
+        self.assertEqual(extension.syntaxfromxml(self.xmlfile).signature, Syntax(handwritten()).signature)
+
+    def test_parse(self):
+        cmd = {"": [{"VARIABLES": ["a", "b"]}, {"ID": ["key"]}],
+            "OPTIONS": [{"METHOD": ["EXACT"]}, {"MISSING": ["YES"]}, {"ITERATIONS": ["20"]}, {"CUTS": ["1", "2.5"]},
+                {"TITLE": ["My Title"]}],
+            "EXTRA": [{"TOKENLIST": ["x", "y", "z"]}]}
+        expected = Syntax(handwritten()).parsecmd(cmd).parsedparams
+        self.assertEqual(extension.syntaxfromxml(self.xmlfile).parsecmd(cmd).parsedparams, expected)
+        self.assertEqual(expected["extra"], ["x", "y", "z"])
+        self.assertEqual(expected["iterations"], 20)
+
+    def test_mode_change(self):
+        # one Syntax object, built once and kept by the template cache, parses each command in the current mode
+        cmd = {"OPTIONS": [{"METHOD": ["EXACT"]}, {"TITLE": ["My Title"]}]}
+        syntax = extension.syntaxfromxml(self.xmlfile)
+        try:
+            for mode in [True, False, True]:
+                spssstub.utf8mode = mode
+                params = syntax.parsecmd(cmd).parsedparams
+                self.assertEqual(params, {"method": "exact", "title": "My Title"})
+                self.assertEqual([type(params["method"]), type(params["title"])], mode and [unicode] * 2 or [str] * 2)
+                self.assertTrue(extension.syntaxfromxml(self.xmlfile).unistr is (mode and unicode or str))
+        finally:
+            spssstub.utf8mode = True
+
+    def test_not_a_command(self):
+        fp = open(self.xmlfile, "w")
+        fp.write('<CommandSpec xmlns="http://xml.spss.com/spss/extension"><Subcommand Name=""/></CommandSpec>')
+        fp.close()
+        self.assertRaises(ValueError, extension.syntaxfromxml, self.xmlfile)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+"""Check that threads sharing one Syntax get their own ParseContext and parsedparams
+
+Each thread parses a mix of commands that are in the parse cache and commands that are not, with and without a
+variable dictionary, and then changes the lists in the result.  No thread may see another thread's result or a
+list changed by another thread.  Threads recording timings at once must not lose a sample.
+
+usage: python -m unittest discover tests"""
+
+import os, sys, random, threading, unittest
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(os.path.dirname(here), "benchmarks"), os.path.dirname(here)]
+import spssstub
+spssstub.install()
+import extension
+from extension import Template, Syntax
+
+threads = 16
+parses = 2000
+
+class ThreadIsolationTest(unittest.TestCase):
+    def setUp(self):
+        self.syntax = Syntax([
+            Template("N", ktype="int", islist=True, vallist=[0, 10**9]),
+            Template("S", ktype="str", vallist=["a", "b", "c"]),
+            Template("L", ktype="literal"),
+            Template("", subc="T", var="toks", ktype="existingvarlist", islist=True)])
+        self.vardict = extension.VariableIndex(["v%d" % i for i in range(50)])
+        self.errors = []
+        self.checkinterval = sys.getcheckinterval()
+        sys.setcheckinterval(10)   # switch threads often
+
+    def tearDown(self):
+        sys.setcheckinterval(self.checkinterval)
+
+    def work(self, tid):
+        rnd = random.Random(tid)
+        contexts = []
+        for i in range(parses):
+            # few distinct numbers and names, so that many parses are served from the cache
+            numbers = [str(rnd.randint(0, 3)) for j in range(rnd.randint(0, 3))]
+            names = ["v%d" % rnd.randint(0, 3)]
+            label = rnd.random() < .5 and "shared" or "t%d-%d" % (tid, i)
+            cmd = {"": [{"N": numbers}, {"L": label}], "T": [{"TOKENLIST": names}]}
+            expected = {"n": [int(n) for n in numbers], "l": label, "toks": names}
+            if rnd.random() < .3:
+                cmd[""].append({"S": rnd.choice("abc")})
+                expected["s"] = cmd[""][2]["S"]
+            context = self.syntax.parsecmd(cmd, rnd.random() < .5 and self.vardict or None)
+            params = context.parsedparams
+            if params != expected:
+                self.errors.append((tid, i, "result", params, expected))
+            if self.syntax.parsedparams is not params:
+                self.errors.append((tid, i, "parsedparams is not this thread's result"))
+            contexts.append(context)
+            # an implementation may change what it was given
+            params["n"].append(-1)
+            params["toks"].append("changed")
+            if rnd.random() < .05:
+                try:
+                    self.syntax.parsecmd({"": [{"S": "zz"}]})
+                    self.errors.append((tid, i, "invalid value accepted"))
+                except AttributeError:
+                    pass
+        if len(set(map(id, contexts))) != len(contexts):
+            self.errors.append((tid, "a ParseContext was reused"))
+        self.contexts[tid] = contexts
+
+    def test_threads(self):
+        self.contexts = {}
+        workers = [threading.Thread(target=self.work, args=(tid,)) for tid in range(threads)]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        self.assertEqual(self.errors, [])
+        every = [id(c) for contexts in self.contexts.values() for c in contexts]
+        self.assertEqual(len(set(every)), threads * parses)
+        self.assertTrue(extension.parsecachestats()["hits"] > 0)
+        # the main thread never parsed, so it has no parsedparams of its own
+        self.assertEqual(self.syntax.parsedparams, {})
+
+    def test_timings(self):
+        # threads adding new phases at once must not lose a sample or break timingstats while it reads them
+        extension.cleartimings()
+        def lap(tid):
+            try:
+                for i in range(parses):
+                    extension._lap("cmd", "phase %d" % (i // 10), 0)   # new phases all along
+                    if i % 100 == 0:
+                        extension.timingstats()
+            except Exception, e:
+                self.errors.append((tid, repr(e)))
+        workers = [threading.Thread(target=lap, args=(tid,)) for tid in range(threads)]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        stats = extension.timingstats()
+        extension.cleartimings()
+        self.assertEqual(self.errors, [])
+        self.assertEqual(len(stats), 200)
+        self.assertEqual(sum(st["count"] for st in stats.values()), threads * parses)
+
+if __name__ == "__main__":
+    unittest.main()
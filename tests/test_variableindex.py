@@ -0,0 +1,55 @@
+"""Check that getvariableindex notices every change to the active dataset dictionary
+
+usage: python -m unittest discover tests"""
+
+import os, sys, unittest
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(os.path.dirname(here), "benchmarks"), os.path.dirname(here)]
+import spssstub
+spssstub.install()
+import extension
+from extension import Template, Syntax
+
+class ActiveIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.saved = spssstub.variables
+        spssstub.variables = ["v%d" % i for i in range(100)]
+        extension.invalidatevariableindex()
+        extension.clearparsecache()
+
+    def tearDown(self):
+        spssstub.variables = self.saved
+        extension.invalidatevariableindex()
+
+    def test_unchanged(self):
+        index = extension.getvariableindex()
+        self.assertTrue(extension.getvariableindex() is index)
+
+    def test_rename(self):
+        # every name, including ones a sample of the names would miss
+        for i in range(100):
+            index = extension.getvariableindex()
+            spssstub.variables[i] = "renamed%d" % i
+            renamed = extension.getvariableindex()
+            self.assertFalse(renamed is index)
+            self.assertNotEqual(renamed.fingerprint, index.fingerprint)
+            self.assertEqual(renamed.names[i], "renamed%d" % i)
+
+    def test_cached_parse(self):
+        oobj = Syntax([Template("VARIABLES", subc="", ktype="existingvarlist", islist=True)])
+        cmd = {"": [{"VARIABLES": ["v10", "to", "v12"]}]}
+        self.assertEqual(oobj.parsecmd(cmd, extension.getvariableindex()).parsedparams["variables"],
+            ["v10", "v11", "v12"])
+        spssstub.variables[11] = "w11"
+        self.assertEqual(oobj.parsecmd(cmd, extension.getvariableindex()).parsedparams["variables"],
+            ["v10", "w11", "v12"])
+
+    def test_fingerprint(self):
+        before = extension.datasetfingerprint()
+        self.assertEqual(extension.datasetfingerprint(), before)
+        spssstub.variables[50] = "w50"
+        self.assertNotEqual(extension.datasetfingerprint(), before)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+"""Check that a WarmPool worker that dies is replaced, and dropped if its replacement cannot start
+
+usage: python -m unittest discover tests"""
+
+import os, sys, locale, unittest
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(os.path.dirname(here), "benchmarks"), os.path.dirname(here)]
+import spssstub
+spssstub.install()
+import extension
+
+def initialize():
+    """Initialize a worker, which has installed the stub by importing this module to find this function.
+
+    Set a locale with an encoding, which the worker converts exception messages with."""
+
+    for name in ["", "C.UTF-8", "en_US.UTF-8"]:
+        try:
+            locale.setlocale(locale.LC_ALL, name)
+        except locale.Error:
+            continue
+        if locale.getlocale()[1] is not None:
+            return
+
+class WarmPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.pool = extension.WarmPool(1, initializer=initialize)
+
+    def tearDown(self):
+        self.pool.close()
+
+    def kill(self):
+        process = self.pool.workers[0][0]
+        process.kill()
+        process.wait()
+
+    def test_restart(self):
+        self.kill()
+        self.assertRaises(RuntimeError, self.pool.run, "NO SUCH COMMAND", {})
+        self.assertEqual(self.pool.stats()["restarts"], 1)
+        self.assertEqual(self.pool.stats()["workers"], 1)
+        self.assertTrue(self.pool.workers[0][0].poll() is None)
+
+    def test_failed_restart(self):
+        self.kill()
+        self.pool.modules = ("no_such_extension_module",)   # the replacement cannot start
+        self.assertRaises(RuntimeError, self.pool.run, "NO SUCH COMMAND", {})
+        stats = self.pool.stats()
+        self.assertEqual((stats["restarts"], stats["workers"]), (1, 0))
+        self.assertEqual(self.pool.idle.qsize(), 0)
+        # later commands fail at once instead of using the dead worker or waiting for an idle one
+        try:
+            self.pool.run("NO SUCH COMMAND", {})
+        except RuntimeError, e:
+            self.assertTrue("No worker processes" in str(e))
+        else:
+            self.fail("RuntimeError not raised")
+
+if __name__ == "__main__":
+    unittest.main()